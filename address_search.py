@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from geocoding import normalize_address
+
+SEARCH_TIMEOUT_S = 8.0
+
+PENDING, FOUND, NOT_FOUND, TIMED_OUT, FAILED = "pending", "found", "not_found", "timed_out", "failed"
+
+
+class _Lookup:
+    """One in-flight provider call, shared by every job for the same address."""
+
+    def __init__(self):
+        self.future = None
+        self.started = None  # set by the worker thread when the call begins
+
+
+class SearchJob:
+    """Handle for one background lookup; poll() never blocks."""
+
+    def __init__(self, query, lookup, timeout, on_timeout=None):
+        self.query = query
+        self.future = lookup.future
+        self.timeout = timeout
+        self._lookup = lookup
+        self._on_timeout = on_timeout
+
+    @property
+    def queued(self):
+        """True while every worker is busy and the lookup has not started."""
+        return self._lookup.started is None
+
+    @property
+    def elapsed(self):
+        started = self._lookup.started
+        return 0.0 if started is None else time.monotonic() - started
+
+    def poll(self):
+        """(state, GeocodeResult | exception | None).
+
+        The clock starts when a worker picks the lookup up, so time spent
+        queued behind other searches does not count. The job is TIMED_OUT
+        once `timeout` seconds have passed, even if the worker is still
+        waiting on the provider; its late result is dropped.
+        """
+        if not self.future.done():
+            if self.elapsed <= self.timeout:
+                return PENDING, None
+            if self._on_timeout is not None:
+                self._on_timeout()
+            return TIMED_OUT, None
+        error = self.future.exception()
+        if error is not None:
+            return FAILED, error
+        result = self.future.result()
+        return (FOUND, result) if result else (NOT_FOUND, None)
+
+
+class BackgroundGeocoder:
+    """Runs a geocode function on worker threads so callers never wait on the network.
+
+    Concurrent searches for the same address (any spelling that normalizes
+    the same) share one in-flight lookup. A lookup that timed out is no
+    longer shared, so searching again starts a fresh one.
+    """
+
+    def __init__(self, geocode, workers=2, timeout=SEARCH_TIMEOUT_S):
+        self.geocode = geocode
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="geocode")
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def submit(self, query):
+        key = normalize_address(query)
+        with self._lock:
+            lookup = self._in_flight.get(key)
+            new = lookup is None
+            if new:
+                lookup = _Lookup()
+                lookup.future = self._executor.submit(self._run, lookup, query)
+                self._in_flight[key] = lookup
+        if new:
+            # Outside the lock: the callback runs right here if the lookup already finished.
+            lookup.future.add_done_callback(lambda _: self._forget(key, lookup))
+        return SearchJob(query, lookup, self.timeout, on_timeout=lambda: self._forget(key, lookup))
+
+    def _run(self, lookup, query):
+        lookup.started = time.monotonic()
+        return self.geocode(query)
+
+    def _forget(self, key, lookup):
+        with self._lock:
+            if self._in_flight.get(key) is lookup:
+                del self._in_flight[key]
+
+
+class QueryHistory:
+    """Recent and popular successful searches; app.py keeps one per browser session.
+
+    suggestions() lists the most recent queries first, then the most
+    frequent ones; both are bounded so the history cannot grow without limit.
+    """
+
+    def __init__(self, recent=10, popular=50):
+        self.recent_size = recent
+        self.popular_size = popular
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()
+        self._counts = Counter()
+
+    def record(self, query):
+        query = " ".join(query.split())
+        if not query:
+            return
+        with self._lock:
+            self._recent.pop(query, None)
+            self._recent[query] = None
+            while len(self._recent) > self.recent_size:
+                self._recent.popitem(last=False)
+            self._counts[query] += 1
+            if len(self._counts) > 2 * self.popular_size:
+                self._counts = Counter(dict(self._counts.most_common(self.popular_size)))
+
+    def suggestions(self, limit=None):
+        with self._lock:
+            queries = list(reversed(self._recent))
+            queries += [q for q, _ in self._counts.most_common(self.popular_size) if q not in self._recent]
+        return queries[:limit]
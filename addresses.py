@@ -0,0 +1,151 @@
+import re
+import sys
+import time
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+COUNTRY = "Việt Nam"
+CITY = "Hà Nội"
+
+# Abbreviation -> full word, applied at the start of an address component
+# ("P. Xuân La", "Q.Hoàn Kiếm", "TP Hà Nội"). An abbreviation must be
+# followed by "." or a space, then a non-digit: "P.302" is a room, "TT1" /
+# "TT2-24" are blocks and "TTTM" a mall. A bare "TT" is usually "tập thể"
+# (a housing estate, "TT Kim Liên"), so only "TT." means "thị trấn".
+ABBREVIATIONS = [
+    (r"p\.\s*(?=\D)|phường\s+", "Phường "),
+    (r"q\.\s*|quận\s+", "Quận "),
+    (r"h\.\s*|huyện\s+", "Huyện "),
+    (r"tx(?:\.\s*|\s+)(?=\D)|thị xã\s+", "Thị xã "),
+    (r"tt\.\s*(?=\D)|thị trấn\s+", "Thị trấn "),
+    (r"tp(?:\.\s*|\s+)(?=\D)|thành phố\s+", "Thành phố "),
+    (r"đ\.\s*|đường\s+", "Đường "),
+    (r"x\.\s*|xã\s+", "Xã "),
+]
+_ABBREVIATIONS = [(re.compile(rf"^(?:{pattern})", re.IGNORECASE), full) for pattern, full in ABBREVIATIONS]
+
+# Components that only name the country or the city, in any spelling.
+_COUNTRY = re.compile(r"^(?:việt\s*nam|viet\s*nam|vietnam|vn)$", re.IGNORECASE)
+_CITY = re.compile(r"^(?:thành phố\s+)?(?:hà\s*nội|ha\s*noi|hanoi|hn)$", re.IGNORECASE)
+# Any other city or province; `city` is not appended to such addresses.
+_OTHER_CITY = re.compile(r"^(?:(?:thành phố|tỉnh)\s+\S|(?:hồ chí minh|hcm|sài gòn|đà nẵng|hải phòng|cần thơ)$)",
+                         re.IGNORECASE)
+
+# District-level prefixes dropped so "Quận Hoàn Kiếm" and "Hoàn Kiếm" match.
+_DISTRICT_PREFIX = re.compile(r"^(?:Quận|Huyện|Thị xã)\s+(?=\D)")
+
+
+def _component(part):
+    part = part.strip(" .-")
+    for pattern, full in _ABBREVIATIONS:
+        if pattern.match(part):
+            return pattern.sub(full, part, count=1)
+    return part
+
+
+def canonical_address(address, city=CITY):
+    """Canonical spelling of a Hanoi address, without the country.
+
+    NFC, single spaces, abbreviations expanded ("P." -> "Phường"),
+    "Quận"/"Huyện" dropped before district names, every spelling of the
+    city collapsed to `city` (appended when missing, unless the address
+    names another city or province) and the country
+    removed. Casing of the input is kept; use address_key() to compare.
+    """
+    if not isinstance(address, str):
+        return None
+    address = re.sub(r"\s+", " ", unicodedata.normalize("NFC", address)).strip()
+    parts = []
+    other_city = False
+    for part in address.split(","):
+        part = _component(part)
+        if not part or _COUNTRY.match(part):
+            continue
+        if _CITY.match(part):
+            part = city
+        else:
+            other_city = other_city or bool(_OTHER_CITY.match(part))
+            part = _DISTRICT_PREFIX.sub("", part)
+        if not parts or parts[-1].casefold() != part.casefold():
+            parts.append(part)
+    if not parts:
+        return None
+    if city and parts[-1] != city and not other_city:
+        parts.append(city)
+    return ", ".join(parts)
+
+
+def address_key(address):
+    """Dedup key: the casefolded canonical address."""
+    canonical = canonical_address(address)
+    return canonical.casefold() if canonical else None
+
+
+def geocoding_query(address, country=COUNTRY):
+    """Canonical address with the country appended, as sent to a geocoder."""
+    canonical = canonical_address(address)
+    return f"{canonical}, {country}" if canonical and country else canonical
+
+
+def dedupe_addresses(addresses):
+    """(unique geocoding queries, codes) such that queries[codes[i]] is the query for addresses[i].
+
+    Rows with no usable address get code -1. Each distinct raw string is
+    normalized once, so this is cheap even with many repeated rows.
+    """
+    raw_codes, raw = pd.factorize(pd.Series(list(addresses), dtype=object), use_na_sentinel=True)
+    keys = pd.Series([address_key(a) for a in raw], dtype=object)
+    key_codes, _ = pd.factorize(keys, use_na_sentinel=True)
+    queries = {}
+    for raw_address, code in zip(raw, key_codes):
+        if code >= 0 and code not in queries:
+            queries[code] = geocoding_query(raw_address)
+    codes = np.where(raw_codes >= 0, key_codes[raw_codes], -1) if len(raw) else np.full(len(raw_codes), -1)
+    return [queries[i] for i in range(len(queries))], codes
+
+
+def _self_check(path="restaurantsHANOI.csv"):
+    same = [
+        ("98 Trần Nhật Duật, Hoàn Kiếm, Hà Nội", "98  Trần Nhật Duật, Q. Hoàn Kiếm, Hà Nội, Việt Nam"),
+        ("98 Trần Nhật Duật, Hoàn Kiếm, Hà Nội", "98 trần nhật duật, quận hoàn kiếm, TP. Hà Nội, Vietnam"),
+        ("34 Ngõ 28 Xuân La, P. Xuân La, Tây Hồ, Hà Nội", "34 Ngõ 28 Xuân La, Phường Xuân La, Q.Tây Hồ, HN"),
+        ("Tầng 1 Aeon Mall, Hà Đông", "Tầng 1 Aeon Mall, Hà Đông, Hà Nội"),
+        (unicodedata.normalize("NFD", "Phố Huế, Hai Bà Trưng"), "Phố Huế, Hai Bà Trưng, Hà Nội"),
+    ]
+    for a, b in same:
+        assert address_key(a) == address_key(b), (address_key(a), address_key(b))
+    assert address_key("12 Đường 1, Q.1") != address_key("12 Đường 1")
+    # Real rows of restaurantsHANOI.csv: blocks, housing estates and malls keep their "TT".
+    kept = {
+        "Nhà 71, TT1, Ngõ 537 Bát Khối, P. Thạch Bàn, Long Biên, Hà Nội":
+            "Nhà 71, TT1, Ngõ 537 Bát Khối, Phường Thạch Bàn, Long Biên, Hà Nội",
+        "TT2-24 Khu Tái Định Cư Ngọc Thụy, P. Ngọc Thụy, Long Biên, Hà Nội":
+            "TT2-24 Khu Tái Định Cư Ngọc Thụy, Phường Ngọc Thụy, Long Biên, Hà Nội",
+        "TT5.2B-26 KĐT Mới Đại Kim, Hoàng Mai, Hà Nội": "TT5.2B-26 KĐT Mới Đại Kim, Hoàng Mai, Hà Nội",
+        "116B15 Lương Định Của, TT Kim Liên, P. Kim Liên, Đống Đa, Hà Nội":
+            "116B15 Lương Định Của, TT Kim Liên, Phường Kim Liên, Đống Đa, Hà Nội",
+        "TTTM Vincom Mega Mall, Long Biên": "TTTM Vincom Mega Mall, Long Biên, Hà Nội",
+        "TT. Trâu Quỳ, Gia Lâm": "Thị trấn Trâu Quỳ, Gia Lâm, Hà Nội",
+        "Số 36 Ngõ 46 Đường Trâu Quỳ, TT.Trâu Quỳ, Gia Lâm, Hà Nội":
+            "Số 36 Ngõ 46 Đường Trâu Quỳ, Thị trấn Trâu Quỳ, Gia Lâm, Hà Nội",
+        "TX Sơn Tây": "Sơn Tây, Hà Nội",
+        "12 Nguyễn Huệ, Q.1, TP. HCM": "12 Nguyễn Huệ, Quận 1, Thành phố HCM",
+        "TP Hà Nội": "Hà Nội",
+    }
+    for raw, canonical in kept.items():
+        assert canonical_address(raw) == canonical, (raw, canonical_address(raw))
+    assert geocoding_query("P. Xuân La, Tây Hồ") == "Phường Xuân La, Tây Hồ, Hà Nội, Việt Nam"
+    assert dedupe_addresses(["A, Hà Nội", None, "a, HN", "B"])[1].tolist() == [0, -1, 0, 1]
+
+    df = pd.read_csv(path, encoding="utf-8-sig")
+    start = time.perf_counter()
+    queries, codes = dedupe_addresses(df["Address"])
+    elapsed = time.perf_counter() - start
+    print(f"{len(df)} rows, {df['Address'].nunique()} distinct raw strings -> "
+          f"{len(queries)} canonical addresses in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    _self_check(*sys.argv[1:])
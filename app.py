@@ -2,71 +2,85 @@ import streamlit as st
 import pandas as pd
 import folium
 from streamlit_folium import st_folium
-from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
 from geopy.exc import GeocoderTimedOut, GeocoderServiceError
-from math import radians, cos, sin, asin, sqrt
-import time
+import os
+from streamlit.errors import StreamlitAPIException
+from spatial import GridIndex, nearest, within_bounds
+from engine import Filters, SiteEngine
+from geocoding import nominatim_geocoder
+from map_layers import CLUSTER_THRESHOLD, DENSITY_METRICS, add_choropleth_layer, add_heatmap_layer, add_restaurant_layer, listing_layer
+from opening_hours import PERIOD_LABELS
+from datastore import read_listing_table, read_restaurants
+from listings import GEOCODED_LISTINGS_FILE
+from recommend import build_site_features, recommend_sites
+from site_grid import CellGrid, aggregate_restaurants, category_cells
+from gazetteer import Gazetteer
+from address_search import FOUND, NOT_FOUND, PENDING, SEARCH_TIMEOUT_S, TIMED_OUT, BackgroundGeocoder, QueryHistory
+from profiling import RunProfiler, configure_logging, start_profile, stop_profile
 
 st.set_page_config(layout="wide")
 
 st.title("Platewise")
 
-geolocator = Nominatim(user_agent="test_geocoder_1.0")
-geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1, error_wait_seconds=10.0, max_retries=2, swallow_exceptions=False)
+# Radius/filter results are memoized per (location rounded to ~1 m, radius, filters).
+QUERY_CACHE_SIZE = 64
+QUERY_PRECISION = 5
 
-def haversine(lon1, lat1, lon2, lat2):
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    r = 6371 
-    return c * 1000 
+# Nominatim lookups run off the script thread; the sidebar polls for the result.
+SEARCH_POLL_S = 0.5
+MAX_SUGGESTIONS = 500
+
+# Per-stage timings are logged as JSON lines when PLATEWISE_PERF_LOG is a file path (or "-" for stderr).
+PERF_LOG = os.environ.get("PLATEWISE_PERF_LOG")
+PROFILE_PATH = "platewise_rerun.prof"
+if PERF_LOG:
+    configure_logging(PERF_LOG)
+
+@st.cache_resource
+def get_geocoder():
+    return nominatim_geocoder("test_geocoder_1.0", min_delay_seconds=1, error_wait_seconds=10.0, max_retries=2)
+
+geocode = get_geocoder()
+
+@st.cache_resource
+def get_gazetteer():
+    return Gazetteer.from_csv()
+
+@st.cache_resource
+def get_background_geocoder():
+    return BackgroundGeocoder(geocode, timeout=SEARCH_TIMEOUT_S)
+
+def get_query_history():
+    # Per session: one user's searches are never suggested to another.
+    if "query_history" not in st.session_state:
+        st.session_state["query_history"] = QueryHistory()
+    return st.session_state["query_history"]
+
+@st.cache_data
+def place_suggestions(limit=MAX_SUGGESTIONS):
+    return get_gazetteer().suggest("", limit)
+
+def search_options():
+    """Recent/popular searches first, then known place names; filtered in the browser as the user types."""
+    history = get_query_history().suggestions()
+    seen = set(history)
+    return history + [name for name in place_suggestions() if name not in seen]
+
+def show_location(location, query):
+    st.session_state["selected_location"] = [location.latitude, location.longitude]
+    st.session_state["map_center"] = [location.latitude, location.longitude]
+    st.session_state["map_zoom"] = 15
+    st.session_state["nearby_restaurants"] = pd.DataFrame()
+    st.session_state["search_message"] = ("success", f"Tìm thấy: {location.address}")
+    get_query_history().record(query)
+
+def request_search():
+    st.session_state["search_requested"] = True
 
 @st.cache_data
 def load_data(file_path):
     try:
-        df = pd.read_csv(file_path)
-        if "latitude" not in df.columns or "longitude" not in df.columns:
-             st.error(f"Lỗi: Tệp {file_path} thiếu cột 'latitude' hoặc 'longitude'.")
-             return pd.DataFrame()
-        df.dropna(subset=["latitude", "longitude"], inplace=True)
-
-        expected_cols = {
-            "rating": {"type": "numeric", "default": pd.NA},
-            "review_count": {"type": "numeric", "default": 0},
-            "category": {"type": "string", "default": "Unknown"},
-            "opening_hours": {"type": "string", "default": "Unknown"},
-            "price_range": {"type": "string", "default": "Unknown"}
-        }
-
-        for col, details in expected_cols.items():
-            if col not in df.columns:
-                df[col] = details["default"]
-            else:
-                if details["type"] == "numeric":
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-                    if pd.isna(details["default"]):
-                         pass 
-                    else:
-                         df[col] = df[col].fillna(details["default"])
-
-                elif details["type"] == "string":
-                    df[col] = df[col].fillna(details["default"]).astype(str) 
-
-        core_cols = ["name", "address", "latitude", "longitude"]
-        for col in core_cols:
-             if col not in df.columns:
-                 st.warning(f"Cột '{col}' không có trong tệp, có thể gây lỗi hiển thị.")
-                 df[col] = "Missing" 
-
-        final_cols = ["name", "address", "latitude", "longitude", "category", "rating", "review_count", "opening_hours", "price_range"]
-        for col in final_cols:
-            if col not in df.columns:
-                 df[col] = expected_cols.get(col, {}).get("default", "Unknown") 
-        return df[final_cols] 
-
+        return read_restaurants(file_path, warn=st.warning)
     except FileNotFoundError:
         st.error(f"Lỗi: Không tìm thấy tệp dữ liệu tại {file_path}")
         return pd.DataFrame()
@@ -74,373 +88,593 @@ def load_data(file_path):
         st.error(f"Lỗi khi tải dữ liệu: {e}")
         return pd.DataFrame()
 
-data_file = "restaurantsHanoi_augmented.csv"
-restaurants_df = load_data(data_file)
+@st.cache_resource
+def get_engine(file_path):
+    return SiteEngine(load_data(file_path))
+
+def build_search(file_path):
+    return get_engine(file_path).index
+
+@st.cache_data
+def load_listings_data(file_path):
+    try:
+        df = read_listing_table(file_path, warn=st.warning)
+    except FileNotFoundError:
+        return pd.DataFrame()
+    df = df.rename(columns={"Latitude": "latitude", "Longitude": "longitude"})
+    if "latitude" not in df.columns or "longitude" not in df.columns:
+        return pd.DataFrame()
+    return df.dropna(subset=["latitude", "longitude"]).reset_index(drop=True)
+
+@st.cache_resource
+def build_listings_search(file_path):
+    df = load_listings_data(file_path)
+    return GridIndex(df["latitude"], df["longitude"], cell_size_m=500)
 
-if restaurants_df.empty:
-    st.warning("Không có dữ liệu nhà hàng để tải hoặc dữ liệu không hợp lệ.")
-    st.stop() 
+@st.cache_data(max_entries=QUERY_CACHE_SIZE, show_spinner=False)
+def search_nearby(file_path, lat, lon, radius_m, categories, min_rating, price_ranges, periods):
+    """Radius query plus sidebar filters -> (filtered rows, rows in radius, QueryStats).
 
-DEFAULT_LOCATION = [21.0285, 105.8542]
-DEFAULT_ZOOM = 13
+    Memoized on the rounded location, radius and filter values; the cache
+    keeps the QUERY_CACHE_SIZE most recently used results.
+    """
+    return get_engine(file_path).search(lat, lon, radius_m, Filters(categories, min_rating, price_ranges, periods))
 
-if "map_center" not in st.session_state:
-    st.session_state["map_center"] = DEFAULT_LOCATION
-if "map_zoom" not in st.session_state:
-    st.session_state["map_zoom"] = DEFAULT_ZOOM
-if "selected_location" not in st.session_state:
-    st.session_state["selected_location"] = None
-if "radius_meters" not in st.session_state:
-    st.session_state["radius_meters"] = 500
-if "nearby_restaurants" not in st.session_state:
-     st.session_state["nearby_restaurants"] = pd.DataFrame() 
+def rerun_fragment():
+    # Fragment-scoped reruns are only allowed while the fragment runs on its own.
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+@st.cache_resource
+def get_site_features(file_path, listings_path):
+    return build_site_features(load_data(file_path), load_listings_data(listings_path))
 
-st.sidebar.header("Tìm kiếm và Lọc")
+@st.cache_resource
+def get_restaurant_cells(file_path):
+    grid = CellGrid()
+    return grid, aggregate_restaurants(load_data(file_path), grid)
 
-address_query = st.sidebar.text_input("Tìm kiếm địa chỉ/phố:", "")
-search_button_clicked = st.sidebar.button("Tìm kiếm")
+@st.cache_data
+def density_cells(file_path, categories):
+    grid, agg = get_restaurant_cells(file_path)
+    return category_cells(agg, grid, categories)
 
-if search_button_clicked and address_query:
+def viewport(bounds):
+    """st_folium bounds -> (south, west, north, east) rounded to ~10 m.
+
+    None until the browser has reported a real viewport (the component's
+    initial value is a zero-size box at the map center).
+    """
     try:
-        location = geocode(address_query + ", Hanoi, Vietnam", timeout=10)
-        if location:
-            st.session_state["selected_location"] = [location.latitude, location.longitude]
-            st.session_state["map_center"] = [location.latitude, location.longitude]
-            st.session_state["map_zoom"] = 15
-            st.sidebar.success(f"Tìm thấy: {location.address}")
-            st.session_state["nearby_restaurants"] = pd.DataFrame()
-            st.rerun() 
+        south, west = bounds["_southWest"]["lat"], bounds["_southWest"]["lng"]
+        north, east = bounds["_northEast"]["lat"], bounds["_northEast"]["lng"]
+    except (KeyError, TypeError):
+        return None
+    if None in (south, west, north, east) or north <= south or east <= west:
+        return None
+    return tuple(round(value, 4) for value in (south, west, north, east))
+
+def padded(bounds, fraction=0.25):
+    south, west, north, east = bounds
+    dlat, dlon = (north - south) * fraction, (east - west) * fraction
+    return south - dlat, west - dlon, north + dlat, east + dlon
+
+perf = RunProfiler("app")
+profile = start_profile() if st.session_state.pop("capture_profile", False) else None
+# st.rerun()/st.stop() end a run by raising, so profiling is stopped in a finally block;
+# otherwise cProfile would stay enabled in the script thread and the report would be lost.
+try:
+    data_file = "restaurantsHanoi_augmented.csv"
+    with perf.stage("load_data") as stage:
+        restaurants_df = load_data(data_file)
+        stage.rows = len(restaurants_df)
+
+    if restaurants_df.empty:
+        st.warning("Không có dữ liệu nhà hàng để tải hoặc dữ liệu không hợp lệ.")
+        st.stop() 
+
+    with perf.stage("build_search", rows=len(restaurants_df)):
+        restaurant_search = build_search(data_file)
+
+    DEFAULT_LOCATION = [21.0285, 105.8542]
+    DEFAULT_ZOOM = 13
+    MAX_LISTING_MARKERS = 300
+
+    if "map_center" not in st.session_state:
+        st.session_state["map_center"] = DEFAULT_LOCATION
+    if "map_zoom" not in st.session_state:
+        st.session_state["map_zoom"] = DEFAULT_ZOOM
+    if "selected_location" not in st.session_state:
+        st.session_state["selected_location"] = None
+    if "radius_meters" not in st.session_state:
+        st.session_state["radius_meters"] = 500
+    if "nearby_restaurants" not in st.session_state:
+         st.session_state["nearby_restaurants"] = pd.DataFrame() 
+    if "map_bounds" not in st.session_state:
+        st.session_state["map_bounds"] = None
+    if "site_recommendations" not in st.session_state:
+        st.session_state["site_recommendations"] = None
+    if "search_job" not in st.session_state:
+        st.session_state["search_job"] = None
+
+    st.sidebar.header("Tìm kiếm và Lọc")
+
+    address_query = st.sidebar.selectbox(
+        "Tìm kiếm địa chỉ/phố:",
+        search_options(),
+        index=None,
+        key="address_query",
+        on_change=request_search,
+        accept_new_options=True,
+        placeholder="Nhập địa chỉ hoặc tên phố...",
+    )
+    search_button_clicked = st.sidebar.button("Tìm kiếm")
+
+    if (search_button_clicked or st.session_state.pop("search_requested", False)) and address_query:
+        st.session_state["search_message"] = None
+        # The local gazetteer answers known streets/districts instantly; Nominatim only on a miss,
+        # in the background so the map stays usable while it is slow or retrying.
+        with perf.stage("gazetteer"):
+            location, level = get_gazetteer().lookup(address_query)
+        if location is not None:
+            show_location(location, address_query)
         else:
-            st.sidebar.error("Không tìm thấy địa chỉ.")
-    except (GeocoderTimedOut, GeocoderServiceError) as e:
-        st.sidebar.error(f"Lỗi Geocoding: {e}")
-    except Exception as e:
-        st.sidebar.error(f"Lỗi không xác định: {e}")
-
-st.session_state["radius_meters"] = st.sidebar.slider(
-    "Chọn bán kính (mét):",
-    min_value=100,
-    max_value=5000,
-    value=st.session_state["radius_meters"],
-    step=50
-)
-st.sidebar.write(f"Bán kính đã chọn: {st.session_state['radius_meters']}m")
-
-st.sidebar.header("Lọc nâng cao")
-
-if "category" in restaurants_df.columns:
-    category_options = sorted(restaurants_df["category"].fillna("Unknown").unique())
-else:
-    category_options = ["Unknown"]
-
-filter_category = st.sidebar.multiselect(
-    "Loại hình nhà hàng:",
-    options=category_options,
-    default=[]
-)
-
-filter_rating = st.sidebar.slider(
-    "Rating tối thiểu:",
-    min_value=0.0,
-    max_value=5.0,
-    value=0.0, 
-    step=0.1
-)
-
-if "price_range" in restaurants_df.columns:
-     price_ranges = sorted([pr for pr in restaurants_df["price_range"].fillna("Unknown").unique() if pr != "Unknown"])
-else:
-     price_ranges = [] 
-
-filter_price_range = st.sidebar.multiselect(
-    "Khoảng giá:",
-    options=price_ranges,
-    default=[]
-)
-
-opening_hours_options = ["Sáng (6:00-11:00)", "Trưa (11:00-14:00)", "Chiều (14:00-17:00)", "Tối (17:00-22:00)", "Đêm (22:00-6:00)"]
-filter_opening_hours = st.sidebar.multiselect(
-    "Giờ mở cửa:",
-    options=opening_hours_options,
-    default=[]
-)
-
-filtered_restaurants_df = pd.DataFrame() 
-nearby_df = pd.DataFrame() 
-
-if st.session_state["selected_location"]:
-    selected_lat, selected_lon = st.session_state["selected_location"]
-
-    nearby_restaurants_list = []
-    for index, row in restaurants_df.iterrows():
-        if pd.notna(row["latitude"]) and pd.notna(row["longitude"]):
-            dist = haversine(selected_lon, selected_lat, row["longitude"], row["latitude"])
-            if dist <= st.session_state["radius_meters"]:
-                nearby_restaurants_list.append(row)
-
-    nearby_df = pd.DataFrame(nearby_restaurants_list)
-
-    if not nearby_df.empty:
-        temp_df = nearby_df.copy() 
-
-        if filter_category and "category" in temp_df.columns:
-            temp_df = temp_df[temp_df["category"].isin(filter_category)]
-
-        if filter_rating > 0.0 and "rating" in temp_df.columns:
-             temp_df["rating"] = pd.to_numeric(temp_df["rating"], errors='coerce')
-             temp_df = temp_df[temp_df["rating"].notna() & (temp_df["rating"] >= filter_rating)]
-
-        if filter_price_range and "price_range" in temp_df.columns:
-            temp_df = temp_df[temp_df["price_range"].isin(filter_price_range)]
-
-        if filter_opening_hours and "opening_hours" in temp_df.columns:
-            filtered_by_hours_indices = []
-            for index, row in temp_df.iterrows():
-                hours_str = str(row["opening_hours"]).lower()
-                include_row = False
-                for period in filter_opening_hours:
-                    period_lower = period.lower()
-                    if ("sáng" in period_lower and ("sáng" in hours_str or "morning" in hours_str or any(t in hours_str for t in ["6:", "7:", "8:", "9:", "10:"]))):
-                        include_row = True; break
-                    elif ("trưa" in period_lower and ("trưa" in hours_str or "noon" in hours_str or any(t in hours_str for t in ["11:", "12:", "13:"]))):
-                         include_row = True; break
-                    elif ("chiều" in period_lower and ("chiều" in hours_str or "afternoon" in hours_str or any(t in hours_str for t in ["14:", "15:", "16:"]))):
-                         include_row = True; break
-                    elif ("tối" in period_lower and ("tối" in hours_str or "evening" in hours_str or any(t in hours_str for t in ["17:", "18:", "19:", "20:", "21:"]))):
-                         include_row = True; break
-                    elif ("đêm" in period_lower and ("đêm" in hours_str or "night" in hours_str or any(t in hours_str for t in ["22:", "23:", "0:", "1:", "2:"]))):
-                         include_row = True; break
-                if include_row:
-                    filtered_by_hours_indices.append(index)
-
-            temp_df = temp_df.loc[filtered_by_hours_indices]
-
-        filtered_restaurants_df = temp_df
-    else:
-         filtered_restaurants_df = pd.DataFrame()
-
-    st.session_state["nearby_restaurants"] = filtered_restaurants_df
-
-m = folium.Map(location=st.session_state["map_center"], zoom_start=st.session_state["map_zoom"], tiles="OpenStreetMap")
-
-if st.session_state["selected_location"]:
-    selected_lat, selected_lon = st.session_state["selected_location"]
-    folium.Marker(
-        location=[selected_lat, selected_lon],
-        popup="Địa điểm tiềm năng",
-        icon=folium.Icon(color="red", icon="pushpin")
-    ).add_to(m)
-    folium.Circle(
-        location=[selected_lat, selected_lon],
-        radius=st.session_state["radius_meters"],
-        color="blue",
-        fill=True,
-        fill_color="blue",
-        fill_opacity=0.1
-    ).add_to(m)
-
-    if "nearby_restaurants" in st.session_state and not st.session_state["nearby_restaurants"].empty:
-        fg = folium.FeatureGroup(name="Nhà hàng lân cận (đã lọc)")
-        for index, row in st.session_state["nearby_restaurants"].iterrows():
-            popup_html = f"<b>{row.get('name', 'N/A')}</b><br>Địa chỉ: {row.get('address', 'N/A')}"
-            category = row.get('category', 'Unknown')
-            rating = row.get('rating') 
-            price_range = row.get('price_range', 'Unknown')
-            opening_hours = row.get('opening_hours', 'Unknown')
-
-            if pd.notna(category) and category != "Unknown":
-                popup_html += f"<br>Loại hình: {category}"
-            if pd.notna(rating):
-                popup_html += f"<br>Rating: {rating:.1f}" 
-            if pd.notna(price_range) and price_range != "Unknown":
-                popup_html += f"<br>Giá: {price_range}"
-            if pd.notna(opening_hours) and opening_hours != "Unknown":
-                 popup_html += f"<br>Giờ mở cửa: {opening_hours}"
-
-            if pd.notna(row.get("latitude")) and pd.notna(row.get("longitude")):
-                 folium.Marker(
-                     location=[row["latitude"], row["longitude"]],
-                     popup=folium.Popup(popup_html, max_width=300),
-                     icon=folium.Icon(color="green", icon="cutlery", prefix="fa")
-                 ).add_to(fg)
-        fg.add_to(m)
-        folium.LayerControl().add_to(m) 
-
-st.write("Nhấp vào bản đồ để chọn địa điểm hoặc tìm kiếm địa chỉ.")
-map_data = st_folium(m, center=st.session_state["map_center"], zoom=st.session_state["map_zoom"], width="100%", height=600, key="folium_map")
-
-if map_data and map_data["last_clicked"]:
-    clicked_lat = map_data["last_clicked"]["lat"]
-    clicked_lon = map_data["last_clicked"]["lng"]
-    current_selection = st.session_state["selected_location"]
-
-    if current_selection is None or \
-       abs(current_selection[0] - clicked_lat) > 1e-5 or \
-       abs(current_selection[1] - clicked_lon) > 1e-5:
-
-        st.session_state["selected_location"] = [clicked_lat, clicked_lon]
-        st.session_state["nearby_restaurants"] = pd.DataFrame()
-        st.rerun() 
-
-st.subheader("Các nhà hàng trong bán kính đã chọn (đã lọc)")
-if st.session_state["selected_location"]:
-    if "nearby_restaurants" in st.session_state and not st.session_state["nearby_restaurants"].empty:
-        display_cols = ["name", "address", "category", "rating", "price_range", "opening_hours"]
-        cols_to_show = [col for col in display_cols if col in st.session_state["nearby_restaurants"].columns]
-        st.dataframe(st.session_state["nearby_restaurants"][cols_to_show].reset_index(drop=True))
-    elif not nearby_df.empty and filtered_restaurants_df.empty:
-         st.info("Không tìm thấy nhà hàng nào phù hợp với bộ lọc đã chọn trong bán kính này.")
-    else:
-        st.info("Không tìm thấy nhà hàng nào trong bán kính này hoặc chưa chọn địa điểm.")
-else:
-    st.info("Vui lòng chọn một địa điểm trên bản đồ hoặc tìm kiếm địa chỉ.")
-
-
-st.header("Quiz gợi ý địa điểm phù hợp")
-st.write("Trả lời các câu hỏi dưới đây để nhận gợi ý về địa điểm phù hợp để mở nhà hàng mới.")
-
-with st.expander("Bắt đầu Quiz", expanded=True):
-    st.subheader("Thông tin cơ bản")
-
-    q1_options = [
-            "Ẩm thực Việt",
-            "Ẩm thực Á (Nhật, Hàn, Trung, Thái...)",
-            "Ẩm thực Âu (Ý, Pháp, Tây Ban Nha...)",
-            "Đồ ăn nhanh/Quốc tế",
-            "Quán cà phê/Trà sữa",
-            "Quán ăn vặt/Đồ ngọt",
-            "Nhà hàng chay",
-            "Khác"
-        ]
-    q1 = st.selectbox(
-        "1. Bạn muốn mở loại hình nhà hàng nào?",
-        options=q1_options, index=0 
+            with perf.stage("geocode_submit"):
+                st.session_state["search_job"] = get_background_geocoder().submit(address_query + ", Hanoi, Vietnam")
+
+    @st.fragment(run_every=SEARCH_POLL_S)
+    def search_status():
+        job = st.session_state["search_job"]
+        if job is None:
+            return
+        state, result = job.poll()
+        if state == PENDING:
+            if job.queued:
+                st.info(f"Đang chờ tìm \"{address_query}\"...")
+            else:
+                st.info(f"Đang tìm \"{address_query}\"... ({job.elapsed:.0f}s)")
+            return
+        st.session_state["search_job"] = None
+        if state == FOUND:
+            show_location(result, address_query)
+        elif state == NOT_FOUND:
+            st.session_state["search_message"] = ("error", "Không tìm thấy địa chỉ.")
+        elif state == TIMED_OUT:
+            st.session_state["search_message"] = ("error", f"Hết thời gian chờ ({SEARCH_TIMEOUT_S:.0f}s), vui lòng thử lại.")
+        elif isinstance(result, (GeocoderTimedOut, GeocoderServiceError)):
+            st.session_state["search_message"] = ("error", f"Lỗi Geocoding: {result}")
+        else:
+            st.session_state["search_message"] = ("error", f"Lỗi không xác định: {result}")
+        st.rerun()
+
+    if st.session_state["search_job"] is not None:
+        with st.sidebar:
+            search_status()
+    message = st.session_state.get("search_message")
+    if message:
+        kind, text = message
+        (st.sidebar.success if kind == "success" else st.sidebar.error)(text)
+
+    st.session_state["radius_meters"] = st.sidebar.slider(
+        "Chọn bán kính (mét):",
+        min_value=100,
+        max_value=5000,
+        value=st.session_state["radius_meters"],
+        step=50
     )
+    st.sidebar.write(f"Bán kính đã chọn: {st.session_state['radius_meters']}m")
 
-    q2_options = [
-            "Sinh viên",
-            "Nhân viên văn phòng",
-            "Gia đình",
-            "Khách du lịch",
-            "Người nước ngoài",
-            "Nhóm bạn bè",
-            "Khách doanh nghiệp"
-        ]
-    q2 = st.multiselect(
-        "2. Đối tượng khách hàng mục tiêu của bạn là ai?",
-        options=q2_options,
-        default=["Nhân viên văn phòng"]
-    )
+    st.sidebar.header("Lọc nâng cao")
 
-    q3_options = ["Bình dân (< 100.000đ)", "Trung bình (100.000đ - 300.000đ)", "Cao cấp (> 300.000đ)"]
-    q3 = st.select_slider(
-        "3. Mức giá dự kiến của nhà hàng?",
-        options=q3_options,
-        value="Trung bình (100.000đ - 300.000đ)"
-    )
+    if "category" in restaurants_df.columns:
+        category_options = sorted(restaurants_df["category"].cat.categories)
+    else:
+        category_options = ["Unknown"]
 
-    q4_options = [
-            "Sáng (6:00-11:00)",
-            "Trưa (11:00-14:00)",
-            "Chiều (14:00-17:00)",
-            "Tối (17:00-22:00)",
-            "Đêm (22:00-6:00)"
-        ]
-    q4 = st.multiselect(
-        "4. Thời gian hoạt động chính?",
-        options=q4_options,
-        default=["Trưa (11:00-14:00)", "Tối (17:00-22:00)"]
+    filter_category = st.sidebar.multiselect(
+        "Loại hình nhà hàng:",
+        options=category_options,
+        default=[]
     )
 
-    st.subheader("Yêu cầu về địa điểm")
-    q5_options = [
-            "Quận Ba Đình",
-            "Quận Hoàn Kiếm",
-            "Quận Hai Bà Trưng",
-            "Quận Đống Đa",
-            "Quận Tây Hồ",
-            "Quận Cầu Giấy",
-            "Quận Thanh Xuân",
-            "Quận Hà Đông",
-            "Quận Long Biên",
-            "Quận Nam Từ Liêm",
-            "Quận Bắc Từ Liêm",
-            "Quận Hoàng Mai"
-        ]
-    q5 = st.multiselect(
-        "5. Khu vực ưu tiên?",
-        options=q5_options,
-        default=["Quận Cầu Giấy", "Quận Đống Đa"]
+    filter_rating = st.sidebar.slider(
+        "Rating tối thiểu:",
+        min_value=0.0,
+        max_value=5.0,
+        value=0.0, 
+        step=0.1
     )
 
-    q6_options = [
-            "Trường học/Đại học",
-            "Văn phòng/Tòa nhà thương mại",
-            "Khu dân cư",
-            "Trung tâm thương mại",
-            "Điểm du lịch",
-            "Công viên",
-            "Bệnh viện"
-        ]
-    q6 = st.multiselect(
-        "6. Bạn muốn gần các tiện ích nào?",
-        options=q6_options,
-        default=["Văn phòng/Tòa nhà thương mại"]
-    )
+    if "price_range" in restaurants_df.columns:
+         price_ranges = sorted([pr for pr in restaurants_df["price_range"].cat.categories if pr != "Unknown"])
+    else:
+         price_ranges = [] 
 
-    q7_options = [
-            "Tránh khu vực có nhiều nhà hàng cùng loại",
-            "Chọn khu vực tập trung nhiều nhà hàng để thu hút khách sẵn có",
-            "Không quan trọng, tập trung vào chất lượng sản phẩm"
-        ]
-    q7 = st.radio(
-        "7. Chiến lược cạnh tranh của bạn?",
-        options=q7_options,
-        index=0
+    filter_price_range = st.sidebar.multiselect(
+        "Khoảng giá:",
+        options=price_ranges,
+        default=[]
     )
 
-    q8_options = ["Nhỏ (< 50m²)", "Trung bình (50-150m²)", "Lớn (> 150m²)"]
-    q8 = st.select_slider(
-        "8. Diện tích mặt bằng cần thiết?",
-        options=q8_options,
-        value="Trung bình (50-150m²)"
+    filter_opening_hours = st.sidebar.multiselect(
+        "Giờ mở cửa:",
+        options=PERIOD_LABELS,
+        default=[]
     )
 
-    q9_options = ["Thấp (< 500 triệu)", "Trung bình (500 triệu - 2 tỷ)", "Cao (> 2 tỷ)"]
-    q9 = st.select_slider(
-        "9. Ngân sách đầu tư?",
-        options=q9_options,
-        value="Trung bình (500 triệu - 2 tỷ)"
+    marker_mode_labels = {"auto": "Tự động", "markers": "Từng điểm", "cluster": "Gom cụm"}
+    marker_mode = st.sidebar.radio(
+        "Hiển thị nhà hàng:",
+        options=list(marker_mode_labels),
+        format_func=marker_mode_labels.get,
+        horizontal=True
     )
 
-    q10_options = [
-            "Chỗ đậu xe",
-            "Wifi miễn phí",
-            "Không gian ngoài trời",
-            "Phòng riêng/VIP",
-            "Giao hàng",
-            "Đặt chỗ trước",
-            "Thanh toán không tiền mặt",
-            "Nhạc sống/Giải trí"
-        ]
-    q10 = st.multiselect(
-        "10. Tính năng bổ sung của nhà hàng?",
-        options=q10_options,
-        default=["Wifi miễn phí", "Giao hàng"]
+    density_layer_labels = {"none": "Không", "heatmap": "Bản đồ nhiệt", "choropleth": "Lưới mức độ cạnh tranh"}
+    density_layer = st.sidebar.selectbox(
+        "Lớp mật độ (theo loại hình đã chọn):",
+        options=list(density_layer_labels),
+        format_func=density_layer_labels.get
     )
-
-    if st.button("Nhận gợi ý địa điểm"):
-        st.subheader("Gợi ý địa điểm (Tính năng đang phát triển)")
-        st.info("Dựa trên câu trả lời của bạn, chúng tôi sẽ phân tích dữ liệu để đưa ra gợi ý khu vực phù hợp.")
-        st.write("Lựa chọn của bạn:")
-        st.write(f"- Loại hình: {q1}")
-        st.write(f"- Khách hàng: {', '.join(q2)}")
-        st.write(f"- Mức giá: {q3}")
-        st.write(f"- Giờ hoạt động: {', '.join(q4)}")
-        st.write(f"- Khu vực: {', '.join(q5)}")
-        st.write(f"- Tiện ích lân cận: {', '.join(q6)}")
-        st.write(f"- Cạnh tranh: {q7}")
-        st.write(f"- Diện tích: {q8}")
-        st.write(f"- Ngân sách: {q9}")
-        st.write(f"- Tính năng: {', '.join(q10)}")
-
+    density_metric = "count"
+    if density_layer != "none":
+        density_metric = st.sidebar.selectbox(
+            "Chỉ số:",
+            options=list(DENSITY_METRICS),
+            format_func=DENSITY_METRICS.get
+        )
+
+    st.sidebar.header("Mặt bằng cho thuê")
+    show_listings = st.sidebar.checkbox("Hiển thị mặt bằng cho thuê", value=False)
+    listings_df = pd.DataFrame()
+    max_listing_price = 0
+    if show_listings:
+        listings_df = load_listings_data(GEOCODED_LISTINGS_FILE)
+        if listings_df.empty:
+            st.sidebar.info(f"Chưa có dữ liệu mặt bằng đã geocode. Chạy `python listings.py --geocode` để tạo {GEOCODED_LISTINGS_FILE}.")
+            show_listings = False
+    if show_listings:
+        max_listing_price = st.sidebar.slider(
+            "Giá thuê tối đa (triệu/tháng):",
+            min_value=0,
+            max_value=500,
+            value=0,
+            step=5,
+            help="0 = không giới hạn"
+        )
+
+    st.sidebar.header("Hiệu năng")
+    debug_perf = st.sidebar.checkbox("Hiển thị thời gian từng bước (debug)", value=False)
+
+    # The map and the quiz are fragments: a map click/pan or a quiz answer reruns
+    # only its own section; sidebar changes still rerun the whole page.
+    @st.fragment
+    def map_section(filter_category, filter_rating, filter_price_range, filter_opening_hours,
+                    marker_mode, density_layer, density_metric, show_listings, max_listing_price, debug_perf):
+        section = RunProfiler("map")
+        filtered_restaurants_df = pd.DataFrame() 
+        nearby_count = 0
+        captions = []
+
+        with section.stage("radius_search") as stage:
+            if st.session_state["selected_location"]:
+                selected_lat, selected_lon = st.session_state["selected_location"]
+
+                filtered_restaurants_df, nearby_count, query_stats = search_nearby(
+                    data_file, round(selected_lat, QUERY_PRECISION), round(selected_lon, QUERY_PRECISION),
+                    st.session_state["radius_meters"], tuple(sorted(filter_category)), filter_rating,
+                    tuple(sorted(filter_price_range)), tuple(sorted(filter_opening_hours)))
+                captions.append(f"Chỉ mục không gian: xét {query_stats.candidates}/{query_stats.total} điểm "
+                                f"(loại bỏ {query_stats.pruned}), {query_stats.matched} trong bán kính.")
+
+                st.session_state["nearby_restaurants"] = filtered_restaurants_df
+            stage.rows = len(filtered_restaurants_df)
+
+        with section.stage("map_build", rows=len(filtered_restaurants_df)):
+            m = folium.Map(location=st.session_state["map_center"], zoom_start=st.session_state["map_zoom"], tiles="OpenStreetMap")
+
+            if st.session_state["selected_location"]:
+                selected_lat, selected_lon = st.session_state["selected_location"]
+                folium.Marker(
+                    location=[selected_lat, selected_lon],
+                    popup="Địa điểm tiềm năng",
+                    icon=folium.Icon(color="red", icon="pushpin")
+                ).add_to(m)
+                folium.Circle(
+                    location=[selected_lat, selected_lon],
+                    radius=st.session_state["radius_meters"],
+                    color="blue",
+                    fill=True,
+                    fill_color="blue",
+                    fill_opacity=0.1
+                ).add_to(m)
+
+                if "nearby_restaurants" in st.session_state and not st.session_state["nearby_restaurants"].empty:
+                    add_restaurant_layer(m, st.session_state["nearby_restaurants"], mode=marker_mode,
+                                         cluster_threshold=CLUSTER_THRESHOLD)
+                    folium.LayerControl().add_to(m) 
+
+        with section.stage("density_layer") as stage:
+            if density_layer != "none":
+                # Only per-cell aggregates go to the browser, never the individual restaurants.
+                grid, _ = get_restaurant_cells(data_file)
+                cells = density_cells(data_file, tuple(sorted(filter_category)))
+                if density_layer == "heatmap":
+                    add_heatmap_layer(m, cells, metric=density_metric)
+                else:
+                    if add_choropleth_layer(m, grid, cells, metric=density_metric) is None:
+                        captions.append(f"Lớp mật độ: không có ô nào có dữ liệu \"{DENSITY_METRICS[density_metric]}\".")
+                stage.rows = len(cells)
+
+        recommendations = st.session_state["site_recommendations"]
+        if recommendations is not None and not recommendations.empty:
+            site_features = get_site_features(data_file, GEOCODED_LISTINGS_FILE)
+            south, west, north, east = site_features.grid.cell_bounds(recommendations["cell"].to_numpy())
+            recommended_group = folium.FeatureGroup(name="Gợi ý địa điểm").add_to(m)
+            for rank, row in enumerate(recommendations.itertuples(), start=1):
+                folium.Rectangle(
+                    bounds=[[south[rank - 1], west[rank - 1]], [north[rank - 1], east[rank - 1]]],
+                    tooltip=f"#{rank} {row.district} (điểm {row.score})",
+                    color="purple",
+                    fill=True,
+                    fill_opacity=0.25
+                ).add_to(recommended_group)
+
+        # Listings are loaded for the viewport st_folium reported on the previous run,
+        # and sent as a separate feature group so panning does not re-render the map.
+        listings_group = None
+        with section.stage("listings") as stage:
+            if show_listings and st.session_state["map_bounds"]:
+                listings_search = build_listings_search(GEOCODED_LISTINGS_FILE)
+                visible_df = within_bounds(listings_df, listings_search, *padded(st.session_state["map_bounds"]))
+                if max_listing_price > 0:
+                    visible_df = visible_df[visible_df["price_vnd_month"] <= max_listing_price * 1e6]
+                if len(visible_df) > MAX_LISTING_MARKERS:
+                    captions.append(f"Hiển thị {MAX_LISTING_MARKERS}/{len(visible_df)} mặt bằng trong khung nhìn; phóng to để xem thêm.")
+                    visible_df = visible_df.sample(MAX_LISTING_MARKERS, random_state=0)
+                else:
+                    captions.append(f"{len(visible_df)} mặt bằng trong khung nhìn.")
+                listings_group = listing_layer(visible_df, mode=marker_mode, cluster_threshold=CLUSTER_THRESHOLD)
+                stage.rows = len(visible_df)
+
+        with section.stage("st_folium"):
+            st.write("Nhấp vào bản đồ để chọn địa điểm hoặc tìm kiếm địa chỉ.")
+            map_data = st_folium(m, center=st.session_state["map_center"], zoom=st.session_state["map_zoom"], width="100%", height=600, key="folium_map",
+                                 feature_group_to_add=listings_group)
+
+        for caption in captions:
+            st.caption(caption)
+
+        if map_data and map_data["last_clicked"]:
+            clicked_lat = map_data["last_clicked"]["lat"]
+            clicked_lon = map_data["last_clicked"]["lng"]
+            current_selection = st.session_state["selected_location"]
+
+            if current_selection is None or \
+               abs(current_selection[0] - clicked_lat) > 1e-5 or \
+               abs(current_selection[1] - clicked_lon) > 1e-5:
+
+                st.session_state["selected_location"] = [clicked_lat, clicked_lon]
+                st.session_state["nearby_restaurants"] = pd.DataFrame()
+                rerun_fragment()
+
+        if show_listings and map_data:
+            bounds = viewport(map_data.get("bounds"))
+            if bounds and bounds != st.session_state["map_bounds"]:
+                st.session_state["map_bounds"] = bounds
+                rerun_fragment()
+
+        with section.stage("results_table", rows=len(filtered_restaurants_df)):
+            st.subheader("Các nhà hàng trong bán kính đã chọn (đã lọc)")
+            if st.session_state["selected_location"]:
+                if "nearby_restaurants" in st.session_state and not st.session_state["nearby_restaurants"].empty:
+                    display_cols = ["name", "address", "distance", "category", "rating", "price_range", "opening_hours"]
+                    cols_to_show = [col for col in display_cols if col in st.session_state["nearby_restaurants"].columns]
+                    st.dataframe(st.session_state["nearby_restaurants"][cols_to_show].reset_index(drop=True))
+                elif nearby_count and filtered_restaurants_df.empty:
+                     st.info("Không tìm thấy nhà hàng nào phù hợp với bộ lọc đã chọn trong bán kính này.")
+                else:
+                    st.info("Không tìm thấy nhà hàng nào trong bán kính này hoặc chưa chọn địa điểm.")
+                    closest_df = nearest(restaurants_df, restaurant_search, *st.session_state["selected_location"], k=5)
+                    if not closest_df.empty:
+                        st.write("Các nhà hàng gần nhất:")
+                        st.dataframe(closest_df[["name", "address", "distance", "category", "rating"]].reset_index(drop=True))
+            else:
+                st.info("Vui lòng chọn một địa điểm trên bản đồ hoặc tìm kiếm địa chỉ.")
+
+        section.emit()
+        # Handed to the full run below; a fragment-only rerun must not add to
+        # the (finished) profiler of the last full run.
+        st.session_state["map_perf"] = section
+        if debug_perf:
+            st.caption(f"Hiệu năng phần bản đồ: {section.elapsed * 1000:.0f} ms")
+            st.dataframe(section.to_frame(), hide_index=True)
+
+
+    map_section(filter_category, filter_rating, filter_price_range, filter_opening_hours,
+                marker_mode, density_layer, density_metric, show_listings, max_listing_price, debug_perf)
+    perf.extend(st.session_state.pop("map_perf"))
+
+
+    @st.fragment
+    def quiz_section():
+        st.header("Quiz gợi ý địa điểm phù hợp")
+        st.write("Trả lời các câu hỏi dưới đây để nhận gợi ý về địa điểm phù hợp để mở nhà hàng mới.")
+
+        with st.expander("Bắt đầu Quiz", expanded=True):
+            st.subheader("Thông tin cơ bản")
+
+            q1_options = [
+                    "Ẩm thực Việt",
+                    "Ẩm thực Á (Nhật, Hàn, Trung, Thái...)",
+                    "Ẩm thực Âu (Ý, Pháp, Tây Ban Nha...)",
+                    "Đồ ăn nhanh/Quốc tế",
+                    "Quán cà phê/Trà sữa",
+                    "Quán ăn vặt/Đồ ngọt",
+                    "Nhà hàng chay",
+                    "Khác"
+                ]
+            q1 = st.selectbox(
+                "1. Bạn muốn mở loại hình nhà hàng nào?",
+                options=q1_options, index=0 
+            )
+
+            q2_options = [
+                    "Sinh viên",
+                    "Nhân viên văn phòng",
+                    "Gia đình",
+                    "Khách du lịch",
+                    "Người nước ngoài",
+                    "Nhóm bạn bè",
+                    "Khách doanh nghiệp"
+                ]
+            q2 = st.multiselect(
+                "2. Đối tượng khách hàng mục tiêu của bạn là ai?",
+                options=q2_options,
+                default=["Nhân viên văn phòng"]
+            )
+
+            q3_options = ["Bình dân (< 100.000đ)", "Trung bình (100.000đ - 300.000đ)", "Cao cấp (> 300.000đ)"]
+            q3 = st.select_slider(
+                "3. Mức giá dự kiến của nhà hàng?",
+                options=q3_options,
+                value="Trung bình (100.000đ - 300.000đ)"
+            )
+
+            q4_options = [
+                    "Sáng (6:00-11:00)",
+                    "Trưa (11:00-14:00)",
+                    "Chiều (14:00-17:00)",
+                    "Tối (17:00-22:00)",
+                    "Đêm (22:00-6:00)"
+                ]
+            q4 = st.multiselect(
+                "4. Thời gian hoạt động chính?",
+                options=q4_options,
+                default=["Trưa (11:00-14:00)", "Tối (17:00-22:00)"]
+            )
+
+            st.subheader("Yêu cầu về địa điểm")
+            q5_options = [
+                    "Quận Ba Đình",
+                    "Quận Hoàn Kiếm",
+                    "Quận Hai Bà Trưng",
+                    "Quận Đống Đa",
+                    "Quận Tây Hồ",
+                    "Quận Cầu Giấy",
+                    "Quận Thanh Xuân",
+                    "Quận Hà Đông",
+                    "Quận Long Biên",
+                    "Quận Nam Từ Liêm",
+                    "Quận Bắc Từ Liêm",
+                    "Quận Hoàng Mai"
+                ]
+            q5 = st.multiselect(
+                "5. Khu vực ưu tiên?",
+                options=q5_options,
+                default=["Quận Cầu Giấy", "Quận Đống Đa"]
+            )
+
+            q6_options = [
+                    "Trường học/Đại học",
+                    "Văn phòng/Tòa nhà thương mại",
+                    "Khu dân cư",
+                    "Trung tâm thương mại",
+                    "Điểm du lịch",
+                    "Công viên",
+                    "Bệnh viện"
+                ]
+            q6 = st.multiselect(
+                "6. Bạn muốn gần các tiện ích nào?",
+                options=q6_options,
+                default=["Văn phòng/Tòa nhà thương mại"]
+            )
+
+            q7_options = [
+                    "Tránh khu vực có nhiều nhà hàng cùng loại",
+                    "Chọn khu vực tập trung nhiều nhà hàng để thu hút khách sẵn có",
+                    "Không quan trọng, tập trung vào chất lượng sản phẩm"
+                ]
+            q7 = st.radio(
+                "7. Chiến lược cạnh tranh của bạn?",
+                options=q7_options,
+                index=0
+            )
+
+            q8_options = ["Nhỏ (< 50m²)", "Trung bình (50-150m²)", "Lớn (> 150m²)"]
+            q8 = st.select_slider(
+                "8. Diện tích mặt bằng cần thiết?",
+                options=q8_options,
+                value="Trung bình (50-150m²)"
+            )
+
+            q9_options = ["Thấp (< 500 triệu)", "Trung bình (500 triệu - 2 tỷ)", "Cao (> 2 tỷ)"]
+            q9 = st.select_slider(
+                "9. Ngân sách đầu tư?",
+                options=q9_options,
+                value="Trung bình (500 triệu - 2 tỷ)"
+            )
+
+            q10_options = [
+                    "Chỗ đậu xe",
+                    "Wifi miễn phí",
+                    "Không gian ngoài trời",
+                    "Phòng riêng/VIP",
+                    "Giao hàng",
+                    "Đặt chỗ trước",
+                    "Thanh toán không tiền mặt",
+                    "Nhạc sống/Giải trí"
+                ]
+            q10 = st.multiselect(
+                "10. Tính năng bổ sung của nhà hàng?",
+                options=q10_options,
+                default=["Wifi miễn phí", "Giao hàng"]
+            )
+
+            if st.button("Nhận gợi ý địa điểm"):
+                quiz_perf = RunProfiler("quiz")
+                with quiz_perf.stage("site_features"):
+                    site_features = get_site_features(data_file, GEOCODED_LISTINGS_FILE)
+                with quiz_perf.stage("recommend_sites", rows=len(site_features.cells)):
+                    st.session_state["site_recommendations"] = recommend_sites(
+                        site_features, cuisine=q1, price_tier=q3, districts=q5, strategy=q7,
+                        periods=q4, area_tier=q8, budget_tier=q9, top_n=10
+                    )
+                quiz_perf.emit()
+                st.rerun()
+
+            recommendations = st.session_state["site_recommendations"]
+            if recommendations is not None:
+                st.subheader("Gợi ý địa điểm")
+                if recommendations.empty:
+                    st.info("Không tìm thấy khu vực phù hợp với lựa chọn của bạn.")
+                else:
+                    st.write("Các ô 500m có điểm cao nhất (được tô màu tím trên bản đồ):")
+                    st.dataframe(recommendations.drop(columns=["cell"]).rename(columns={
+                        "district": "Khu vực", "score": "Điểm", "competitors": "Đối thủ cùng loại",
+                        "competitor_rating": "Rating đối thủ", "restaurants": "Tổng nhà hàng",
+                        "reviews": "Tổng review", "listings": "Mặt bằng phù hợp"
+                    }))
+                    st.caption("Điểm tính từ loại hình, mức giá, giờ hoạt động, khu vực, chiến lược cạnh tranh, "
+                               "diện tích và ngân sách; đối tượng khách, tiện ích và tính năng chưa được dùng để chấm điểm.")
+
+
+    quiz_section()
+
+    perf.emit()
+finally:
+    if profile is not None:
+        st.session_state["profile_report"] = stop_profile(profile, PROFILE_PATH)
+
+if debug_perf:
+    with st.sidebar.expander("Thời gian lần chạy gần nhất", expanded=True):
+        st.dataframe(perf.to_frame(), hide_index=True)
+        st.caption(f"Tổng: {perf.elapsed * 1000:.0f} ms")
+        if st.button("Ghi cProfile cho lần chạy kế tiếp"):
+            st.session_state["capture_profile"] = True
+            st.rerun()
+        if st.session_state.get("profile_report"):
+            st.caption(f"cProfile (đã lưu vào {PROFILE_PATH}):")
+            st.code(st.session_state["profile_report"], language=None)
@@ -0,0 +1,255 @@
+import csv
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+from geopy.exc import GeocoderServiceError
+
+from addresses import dedupe_addresses
+from geocoding import CachedGeocoder, GeocodeCache, GeocodeResult, TokenBucket
+
+BatchStats = namedtuple("BatchStats", ["rows", "found", "not_found", "failed", "retries", "elapsed", "rows_per_sec"])
+
+
+def _geocode_with_retries(geocode, address, retries, backoff, retry_on):
+    attempt = 0
+    while True:
+        try:
+            return geocode(address), attempt, None
+        except Exception as e:
+            if attempt >= retries or not isinstance(e, retry_on):
+                return None, attempt, e
+            time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+            attempt += 1
+
+
+def geocode_batch(addresses, geocode, workers=8, retries=3, backoff=0.5, retry_on=(Exception,), progress_every=100):
+    """Geocode `addresses` on a thread pool; results come back in input order.
+
+    `geocode` is a callable address -> GeocodeResult | None, normally a
+    CachedGeocoder built with a shared TokenBucket limiter so the provider
+    quota holds across workers. Empty/non-string addresses are skipped,
+    lookups raising one of `retry_on` are retried with jittered exponential
+    backoff, and a row ends up as None if every attempt fails.
+    """
+    results, errors, stats = _run_batch(addresses, geocode, workers, retries, backoff, retry_on, progress_every)
+    return results, stats
+
+
+def _run_batch(addresses, geocode, workers=8, retries=3, backoff=0.5, retry_on=(Exception,), progress_every=100):
+    addresses = list(addresses)
+    results = [None] * len(addresses)
+    errors = [None] * len(addresses)
+    found = not_found = failed = total_retries = done = 0
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for i, address in enumerate(addresses):
+            if isinstance(address, str) and address.strip():
+                futures[executor.submit(_geocode_with_retries, geocode, address, retries, backoff, retry_on)] = i
+            else:
+                not_found += 1
+        for future in as_completed(futures):
+            i = futures[future]
+            result, attempts, error = future.result()
+            total_retries += attempts
+            results[i] = result
+            errors[i] = error
+            if error is not None:
+                failed += 1
+                print(f"  Error geocoding '{addresses[i]}': {error}")
+            elif result is None:
+                not_found += 1
+            else:
+                found += 1
+            done += 1
+            if progress_every and done % progress_every == 0:
+                elapsed = time.perf_counter() - start
+                print(f"  {done}/{len(futures)} geocoded ({done / elapsed:.1f} rows/sec)")
+
+    elapsed = time.perf_counter() - start
+    rate = len(addresses) / elapsed if elapsed > 0 else float("inf")
+    return results, errors, BatchStats(len(addresses), found, not_found, failed, total_retries, elapsed, rate)
+
+
+def apply_results(df, results, lat_col="Latitude", lon_col="Longitude"):
+    df[lat_col] = [r.latitude if r else None for r in results]
+    df[lon_col] = [r.longitude if r else None for r in results]
+    return df
+
+
+def checkpoint_path(output_file):
+    return output_file + ".checkpoint.csv"
+
+
+def _load_checkpoint(path, addresses):
+    """Rows finished by an earlier run, as {row: (lat, lon, source)}; lat/lon are None when not found."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, newline="", encoding="utf-8") as f:
+        for record in csv.DictReader(f):
+            try:
+                row = int(record["row"])
+            except (KeyError, TypeError, ValueError):
+                continue  # torn last line from a killed run
+            if row < len(addresses) and str(addresses[row]) == record["address"]:
+                lat, lon = record["latitude"], record["longitude"]
+                source = record.get("source") or None
+                done[row] = (float(lat), float(lon), source) if lat and lon else (None, None, None)
+    return done
+
+
+def _prefill_from_output(df, output_file, address_col, lat_col, lon_col, source_col):
+    if not os.path.exists(output_file):
+        return
+    previous = pd.read_csv(output_file)
+    if not {address_col, lat_col, lon_col} <= set(previous.columns):
+        return
+    previous = previous.dropna(subset=[lat_col, lon_col]).drop_duplicates(address_col)
+    known = previous.set_index(address_col)
+    missing = df[lat_col].isna() | df[lon_col].isna()
+    columns = [lat_col, lon_col] + ([source_col] if source_col and source_col in known.columns else [])
+    for col in columns:
+        df.loc[missing, col] = df.loc[missing, address_col].map(known[col])
+
+
+def geocode_dataframe(df, geocode, output_file, address_col="Address", addresses=None,
+                      lat_col="Latitude", lon_col="Longitude", chunk_size=200, dedupe=True,
+                      source=None, source_col="GeocodeSource", **batch_kwargs):
+    """Resumable geocoding of df into output_file.
+
+    Rows that already have coordinates (in df, or by address in an existing
+    output_file) are skipped. The rest are geocoded `chunk_size` rows at a
+    time and every finished chunk is appended to a sidecar checkpoint CSV,
+    so a crashed or killed run picks up after the last completed chunk.
+    Rows whose lookup raised are not checkpointed and are retried next run.
+    `addresses` overrides the strings sent to the geocoder; it defaults to
+    df[address_col].
+
+    With `dedupe`, pending rows are collapsed to unique canonical addresses
+    (see addresses.dedupe_addresses, which also appends the country), each
+    is looked up once and the result is fanned back out to every row;
+    `chunk_size` then counts unique addresses.
+
+    With `source` (a callable query -> label, such as
+    TieredGeocoder.source), every found row records where its coordinates
+    came from in `source_col`.
+    """
+    df = df.reset_index(drop=True)
+    if addresses is None:
+        addresses = df[address_col]
+    addresses = list(addresses)
+    for col in (lat_col, lon_col):
+        if col not in df.columns:
+            df[col] = float("nan")
+    if source is None:
+        source_col = None
+    elif source_col not in df.columns:
+        df[source_col] = None
+    _prefill_from_output(df, output_file, address_col, lat_col, lon_col, source_col)
+
+    ckpt = checkpoint_path(output_file)
+    done = _load_checkpoint(ckpt, addresses)
+    if done:
+        rows = list(done)
+        df.loc[rows, lat_col] = [done[r][0] for r in rows]
+        df.loc[rows, lon_col] = [done[r][1] for r in rows]
+        if source_col:
+            df.loc[rows, source_col] = [done[r][2] for r in rows]
+        print(f"Resuming from checkpoint {ckpt}: {len(done)} rows already done")
+
+    pending = [i for i in df.index[df[lat_col].isna() | df[lon_col].isna()] if i not in done]
+    if dedupe:
+        queries, codes = dedupe_addresses([addresses[i] for i in pending])
+        groups = [[] for _ in queries]
+        for i, code in zip(pending, codes):
+            if code >= 0:
+                groups[code].append(i)
+        print(f"{len(pending)} of {len(df)} rows need geocoding ({len(queries)} unique addresses)")
+    else:
+        queries = [addresses[i] for i in pending]
+        groups = [[i] for i in pending]
+        print(f"{len(pending)} of {len(df)} rows need geocoding")
+
+    batch_kwargs.setdefault("progress_every", 0)
+    new_file = not os.path.exists(ckpt)
+    counts = {"found": 0, "not_found": len(pending) - sum(map(len, groups)), "failed": 0, "retries": 0}
+    elapsed = 0.0
+    with open(ckpt, "a", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(["row", "address", "latitude", "longitude", "source"])
+        for start in range(0, len(queries), chunk_size):
+            chunk = range(start, min(start + chunk_size, len(queries)))
+            results, errors, stats = _run_batch([queries[q] for q in chunk], geocode, **batch_kwargs)
+            for q, result, error in zip(chunk, results, errors):
+                rows = groups[q]
+                if error is not None:
+                    counts["failed"] += len(rows)
+                    continue
+                counts["found" if result is not None else "not_found"] += len(rows)
+                label = source(queries[q]) if source is not None and result is not None else None
+                if result is not None:
+                    df.loc[rows, [lat_col, lon_col]] = [result.latitude, result.longitude]
+                    if source_col:
+                        df.loc[rows, source_col] = label
+                for i in rows:
+                    writer.writerow([i, addresses[i], result.latitude if result else "",
+                                     result.longitude if result else "", label or ""])
+            f.flush()
+            counts["retries"] += stats.retries
+            elapsed += stats.elapsed
+            print(f"  checkpointed {chunk.stop}/{len(queries)} addresses "
+                  f"({stats.rows_per_sec:.2f} lookups/sec)")
+
+    tmp_file = output_file + ".tmp"
+    df.to_csv(tmp_file, index=False, encoding="utf-8-sig")
+    os.replace(tmp_file, output_file)
+    os.remove(ckpt)
+    rate = len(pending) / elapsed if elapsed > 0 else float("inf")
+    return df, BatchStats(len(pending), elapsed=elapsed, rows_per_sec=rate, **counts)
+
+
+class StubGeocoder:
+    """Local stand-in for a provider: fixed latency, random failures, fake Hanoi coordinates."""
+
+    def __init__(self, latency=0.05, error_rate=0.1, not_found_rate=0.05, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.not_found_rate = not_found_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def __call__(self, address):
+        with self._lock:
+            self.calls += 1
+            roll = self._random.random()
+        time.sleep(self.latency)
+        if roll < self.error_rate:
+            raise GeocoderServiceError("stub: injected failure")
+        if roll < self.error_rate + self.not_found_rate:
+            return None
+        digest = hashlib.md5(address.encode("utf-8")).digest()
+        return GeocodeResult(20.95 + digest[0] / 2550, 105.75 + digest[1] / 2550, address)
+
+
+def benchmark(n=300, latency=0.05, rate=100.0, burst=10):
+    addresses = [f"{i} Phố Huế, Hai Bà Trưng, Hà Nội" for i in range(n)]
+    for workers in (1, 8, 32):
+        stub = StubGeocoder(latency=latency)
+        geocode = CachedGeocoder("stub", stub, GeocodeCache(":memory:"), TokenBucket(rate, burst))
+        results, stats = geocode_batch(addresses, geocode, workers=workers, backoff=0.05, progress_every=0)
+        print(f"workers={workers:>2}  {stats.rows_per_sec:7.1f} rows/sec  found={stats.found}"
+              f"  not_found={stats.not_found}  failed={stats.failed}  retries={stats.retries}  calls={stub.calls}")
+
+
+if __name__ == "__main__":
+    benchmark()
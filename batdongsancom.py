@@ -1,9 +1,22 @@
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException
-import time
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import lxml.html
+import requests
+from listing_store import DEFAULT_STORE_PATH, ListingSink, ListingStore
+import argparse
 import csv
+import os
+import queue
+import tempfile
+import threading
+import time
 
 def create_driver():
     chrome_options = Options()
@@ -13,118 +26,452 @@ def create_driver():
     return webdriver.Chrome(options=chrome_options)
 
 
-def parse_listing(card_div):
-    """Extract data from a single listing element (WebElement)"""
-    try:
-        link = card_div.find_element(By.CSS_SELECTOR, 'a.js__product-link-for-product-id')
-        product_id = link.get_attribute('data-product-id')
-        href = link.get_attribute('href')
-        title = link.get_attribute('title').strip()
-    except NoSuchElementException:
+def _has_class(cls):
+    return f'contains(concat(" ", normalize-space(@class), " "), " {cls} ")'
+
+
+def _first_text(node, xpath):
+    found = node.xpath(xpath)
+    if not found:
+        return ''
+    return " ".join(found[0].text_content().split())
+
+
+def parse_listing(card):
+    """Extract data from a single listing card (lxml element)"""
+    links = card.xpath(f'.//a[{_has_class("js__product-link-for-product-id")}]')
+    if not links:
         return None
+    link = links[0]
 
     images = []
-    for img in card_div.find_elements(By.CSS_SELECTOR, 'img[data-img]'):
-        src = img.get_attribute('data-img') or img.get_attribute('src')
+    for img in card.xpath('.//img[@data-img]'):
+        src = img.get('data-img') or img.get('src')
         if src:
             images.append(src)
 
-    price = area = toilet = location = description = published = ''
-    try:
-        price = card_div.find_element(By.CSS_SELECTOR, 'span.re__card-config-price').text.strip()
-    except NoSuchElementException:
-        pass
+    return {
+        'product_id': link.get('data-product-id'),
+        'title': (link.get('title') or '').strip(),
+        'url': link.get('href'),
+        'images': images,
+        'price': _first_text(card, f'.//span[{_has_class("re__card-config-price")}]'),
+        'area': _first_text(card, f'.//span[{_has_class("re__card-config-area")}]'),
+        'toilet': _first_text(card, f'.//span[{_has_class("re__card-config-toilet")}]//span'),
+        'location': _first_text(card, f'.//div[{_has_class("re__card-location")}]//span[not({_has_class("re__card-config-dot")})]'),
+        'description': _first_text(card, f'.//div[{_has_class("re__card-description")}]'),
+        'published': _first_text(card, f'.//span[{_has_class("re__card-published-info-published-at")}]'),
+    }
+
+
+def parse_listings_html(html, url=None):
+    """Parse every card and the next-page link out of a listing page in one pass.
+
+    Returns (listings, has_next, n_cards).
+    """
+    tree = lxml.html.fromstring(html, base_url=url)
+    if url:
+        tree.make_links_absolute(url)
+    cards = tree.xpath(f'//div[{_has_class("js__card")}]')
+    listings = [data for data in (parse_listing(card) for card in cards) if data]
+    has_next = bool(tree.xpath(f'//a[{_has_class("re__pagination-icon")} and @pid]'))
+    return listings, has_next, len(cards)
+
+
+CATEGORIES = {
+    "kiot": ("https://batdongsan.com.vn/cho-thue-sang-nhuong-cua-hang-ki-ot-ha-noi", "kiot_listings.csv"),
+    "shophouse": ("https://batdongsan.com.vn/cho-thue-shophouse-nha-pho-thuong-mai-ha-noi", "shophouse_listings.csv"),
+}
+BASE_URL = CATEGORIES["kiot"][0]
+
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "Accept-Language": "vi-VN,vi;q=0.9,en;q=0.8",
+}
+
+
+def page_url(page_num, base_url=BASE_URL):
+    return f"{base_url}/p{page_num}"
+
+
+class DriverPool:
+    """Bounded pool of long-lived WebDriver instances, created on first use."""
+
+    def __init__(self, size, factory=create_driver):
+        self.size = size
+        self.factory = factory
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def driver(self):
+        try:
+            driver = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    driver = self.factory()
+                except BaseException:
+                    self._release_slot()
+                    raise
+            else:
+                driver = self._idle.get()
+        healthy = True
+        try:
+            yield driver
+        except WebDriverException:
+            healthy = False
+            raise
+        finally:
+            # Any other error (a parse failure, Ctrl-C) is not the browser's
+            # fault; it goes back to the pool so close() can quit it. A
+            # crashed/hung browser is replaced instead.
+            if healthy:
+                self._idle.put(driver)
+            else:
+                self._discard(driver)
+
+    def _release_slot(self):
+        with self._lock:
+            self._created -= 1
+
+    def _discard(self, driver):
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+        finally:
+            self._release_slot()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().quit()
+            except queue.Empty:
+                break
+
+
+def create_session(pool_size=8):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=2)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(HTTP_HEADERS)
+    return session
+
+
+def fetch_page_http(page_num, session, base_url=BASE_URL, timeout=20):
+    """Static fetch + parse; returns (listings, has_next) or None when no cards were found."""
+    url = page_url(page_num, base_url)
+    print(f"Fetching page {page_num}: {url}")
     try:
-        area = card_div.find_element(By.CSS_SELECTOR, 'span.re__card-config-area').text.strip()
-    except NoSuchElementException:
-        pass
+        response = session.get(url, timeout=timeout)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"  HTTP fetch failed for page {page_num}: {e}")
+        return None
+    listings, has_next, n_cards = parse_listings_html(response.text, url)
+    if not n_cards:
+        return None
+    print(f"  -> Found {n_cards} listings on page {page_num} (static)")
+    return listings, has_next
+
+
+def scrape_page(page_num, driver=None, base_url=BASE_URL, wait=10):
+    """Load one page in a browser and return (listings, has_next) from that single page load."""
+    own_driver = driver is None
+    if own_driver:
+        driver = create_driver()
     try:
-        toilet = card_div.find_element(By.CSS_SELECTOR, 'span.re__card-config-toilet span').text.strip()
-    except NoSuchElementException:
-        pass
+        url = page_url(page_num, base_url)
+        print(f"Loading page {page_num}: {url}")
+        driver.get(url)
+        try:
+            WebDriverWait(driver, wait).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, 'div.js__card, a.re__pagination-icon'))
+            )
+        except TimeoutException:
+            pass
+
+        listings, has_next, n_cards = parse_listings_html(driver.page_source, driver.current_url)
+        print(f"  -> Found {n_cards} listings on page {page_num}")
+        return listings, has_next
+    finally:
+        if own_driver:
+            driver.quit()
+
+
+def _scrape_one(pool, session, page_num, base_url):
+    if session is not None:
+        result = fetch_page_http(page_num, session, base_url)
+        if result is not None:
+            return result
+        print(f"  Falling back to Selenium for page {page_num}")
+    with pool.driver() as driver:
+        return scrape_page(page_num, driver, base_url)
+
+
+def scrape_pages(page_nums, pool, base_url=BASE_URL, session=None):
+    """Fetch pages concurrently (one worker per pooled driver); results keyed by page.
+
+    With a requests `session` each page is first fetched and parsed as static
+    HTML; a browser from the pool is only used when that finds no cards.
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        futures = {executor.submit(_scrape_one, pool, session, page, base_url): page for page in page_nums}
+        for future in as_completed(futures):
+            page = futures[future]
+            try:
+                results[page] = future.result()
+            except WebDriverException as e:
+                print(f"  Error loading page {page}: {e}")
+                results[page] = ([], False)
+    return results
+
+
+def main(max_pages=None, delay=2, workers=4, base_url=BASE_URL, output_file='kiot_listings.csv', static=True,
+         store=None, category="kiot", driver_factory=create_driver):
+    """Crawl pages until the last one; with a ListingStore, crawl incrementally.
+
+    Listings are streamed to output_file (CSV or .jsonl) page by page. In
+    incremental mode only new or changed listings (by product_id and
+    content hash) are upserted into the store, pagination stops at the
+    first page whose listings are all known and unchanged (a page whose
+    listings all lack a product_id does not count), and output_file is
+    rewritten from the store at the end. `driver_factory` creates the pooled
+    browsers used when the static fetch finds no cards.
+    """
+    sink = ListingSink(output_file) if store is None else None
+    n_new = n_changed = 0
+    pool = DriverPool(workers, driver_factory)
+    session = create_session(workers) if static else None
+    start = time.perf_counter()
+    pages_done = 0
+    page = 1
     try:
-        location = card_div.find_element(By.CSS_SELECTOR, 'div.re__card-location span:not(.re__card-config-dot)').text.strip()
-    except NoSuchElementException:
+        while True:
+            batch = list(range(page, page + workers))
+            if max_pages:
+                batch = [p for p in batch if p <= max_pages]
+            print(f"== Processing pages {batch[0]}-{batch[-1]} ==")
+            results = scrape_pages(batch, pool, base_url, session)
+
+            stop = False
+            for p in batch:
+                listings, has_next = results[p]
+                pages_done += 1
+                if not listings:
+                    print(f"No listings found on page {p}, stopping.")
+                    stop = True
+                    break
+                print(f"Page {p}: next page exists: {has_next}")
+                if store is not None:
+                    new, changed, unchanged = store.classify(category, listings)
+                    store.upsert(category, new + changed)
+                    store.touch(category, unchanged)
+                    n_new += len(new)
+                    n_changed += len(changed)
+                    print(f"  {len(new)} new, {len(changed)} changed, {len(unchanged)} unchanged")
+                    if not new and not changed:
+                        if unchanged:
+                            print("Page has only known, unchanged listings, stopping.")
+                            stop = True
+                            break
+                        print("  No listing on this page has a product_id, continuing.")
+                else:
+                    sink.write_page(listings)
+                if not has_next:
+                    stop = True
+                    break
+            page = batch[-1] + 1
+            if stop or (max_pages and page > max_pages):
+                break
+            time.sleep(delay)
+    finally:
+        pool.close()
+        if session is not None:
+            session.close()
+        if sink is not None:
+            sink.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Scraped {pages_done} pages in {elapsed:.1f}s ({pages_done / elapsed * 60:.1f} pages/min)")
+
+    if store is not None:
+        total = store.export(category, output_file)
+        print(f"{n_new} new and {n_changed} changed listings; saved {total} listings to {output_file}.")
+    elif sink.count:
+        print(f"Saved {sink.count} listings to {output_file}.")
+    else:
+        print("No data scraped.")
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "batdongsan")
+
+# fixture -> (category, page, cards on the page, has_next, expected fields of the parsed listings)
+FIXTURE_PAGES = {
+    "kiot_p1.html": ("kiot", 1, 3, True, [
+        {"product_id": "42871483", "price": "7 triệu/tháng", "area": "50 m²", "toilet": "1",
+         "location": "Hoài Đức, Hà Nội", "published": "Đăng hôm qua", "n_images": 3},
+        {"product_id": "40223186", "price": "15 triệu/tháng", "area": "400 m²", "toilet": "",
+         "location": "Thạch Thất, Hà Nội", "published": "Đăng 3 ngày trước", "n_images": 3},
+    ]),
+    # Last page; its card has lost data-product-id.
+    "kiot_p2.html": ("kiot", 2, 1, False, [
+        {"product_id": None, "price": "50 triệu/tháng", "area": "2.000 m²", "toilet": "1",
+         "location": "Hà Đông, Hà Nội", "published": "Đăng 3 ngày trước", "n_images": 3},
+    ]),
+    "shophouse_p1.html": ("shophouse", 1, 2, True, [
+        {"product_id": "42824448", "price": "180 triệu/tháng", "area": "180 m²", "toilet": "",
+         "location": "Hà Đông, Hà Nội", "published": "Đăng 1 tuần trước", "n_images": 4},
+        {"product_id": "42813406", "price": "875 nghìn/m²", "area": "116 m²", "toilet": "",
+         "location": "Ba Đình, Hà Nội", "published": "Đăng 1 tuần trước", "n_images": 4},
+    ]),
+}
+
+
+def _read_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    # /<category>/p<N> -> fixtures/batdongsan/<category>_p<N>.html, like page_url() on the real site.
+    def do_GET(self):
+        name = self.path.strip("/").replace("/", "_") + ".html"
+        if name not in FIXTURE_PAGES:
+            self.send_error(404)
+            return
+        body = _read_fixture(name).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
         pass
+
+
+@contextmanager
+def fixture_server():
+    """Serve the fixture pages on localhost; yields the base URL (append /<category>)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FixtureHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
     try:
-        description = card_div.find_element(By.CSS_SELECTOR, 'div.re__card-description').text.strip()
-    except NoSuchElementException:
-        pass
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _no_browser():
+    raise AssertionError("the fixture crawl should not need Selenium")
+
+
+def _blocked_browser():
+    raise WebDriverException("blocked")
+
+
+def _check_selenium_crawl(root, workdir):
+    """Crawl the fixture pages through DriverPool and real browsers; skipped without Chrome/chromedriver."""
     try:
-        published = card_div.find_element(By.CSS_SELECTOR, 'span.re__card-published-info-published-at').text.strip()
-    except NoSuchElementException:
-        pass
+        create_driver().quit()
+    except WebDriverException as e:
+        print(f"Selenium crawl skipped: no usable Chrome/chromedriver ({e.msg or type(e).__name__}).")
+        return
+    created = []
 
-    return {
-        'product_id': product_id,
-        'title': title,
-        'url': href,
-        'images': images,
-        'price': price,
-        'area': area,
-        'toilet': toilet,
-        'location': location,
-        'description': description,
-        'published': published
-    }
+    def counting_driver():
+        created.append(create_driver())
+        return created[-1]
 
+    output_file = os.path.join(workdir, "kiot_selenium.csv")
+    main(delay=0, workers=2, base_url=f"{root}/kiot", output_file=output_file, static=False,
+         driver_factory=counting_driver)
+    with open(output_file, encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["product_id"] for row in rows] == ["42871483", "40223186", ""], rows
+    # Two pages on two workers: the pool never needs more than one browser per worker.
+    assert 1 <= len(created) <= 2, len(created)
+    print(f"Selenium crawl: {len(rows)} listings with {len(created)} pooled browsers.")
 
-def scrape_page(page_num):
-    """Mở session mới, load page và parse listings"""
-    driver = create_driver()
-    url = f"https://batdongsan.com.vn/cho-thue-sang-nhuong-cua-hang-ki-ot-ha-noi/p{page_num}"
-    print(f"Starting new session for page {page_num}: {url}")
-    driver.get(url)
-    time.sleep(3)
 
-    cards = driver.find_elements(By.CSS_SELECTOR, 'div.js__card')
-    print(f"  -> Found {len(cards)} listings on page {page_num}")
-    listings = []
-    for card in cards:
-        data = parse_listing(card)
-        if data:
-            listings.append(data)
+def self_check():
+    """Parse the saved fixture pages and compare every extracted field, then crawl them over HTTP
+    (statically, and through the browser pool when Chrome is installed)."""
+    for name, (category, page, n_cards, has_next, expected) in FIXTURE_PAGES.items():
+        url = page_url(page, CATEGORIES[category][0])
+        listings, found_next, found_cards = parse_listings_html(_read_fixture(name), url)
+        assert (found_cards, found_next, len(listings)) == (n_cards, has_next, len(expected)), \
+            (name, found_cards, found_next, len(listings))
+        for listing, fields in zip(listings, expected):
+            fields = dict(fields)
+            assert len(listing["images"]) == fields.pop("n_images"), (name, listing["images"])
+            assert all(img.startswith("https://file4.batdongsan.com.vn/") for img in listing["images"])
+            for key, value in fields.items():
+                assert listing[key] == value, (name, key, listing[key], value)
+            assert listing["url"].startswith("https://batdongsan.com.vn/cho-thue-"), listing["url"]
+            assert listing["title"] and listing["description"], name
+        print(f"{name}: {found_cards} cards, {len(listings)} listings, has_next={found_next}")
 
-    driver.quit()
-    return listings
+    with fixture_server() as root, tempfile.TemporaryDirectory() as workdir:
+        output_file = os.path.join(workdir, "kiot.csv")
+        main(delay=0, workers=2, base_url=f"{root}/kiot", output_file=output_file, driver_factory=_no_browser)
+        with open(output_file, encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        assert [row["product_id"] for row in rows] == ["42871483", "40223186", ""], rows
 
+        # A blocked crawl (404 on the static fetch, browser fails too) must
+        # not truncate the previous output.
+        main(delay=0, workers=1, base_url=f"{root}/missing", output_file=output_file,
+             driver_factory=_blocked_browser)
+        with open(output_file, encoding="utf-8") as f:
+            assert len(list(csv.DictReader(f))) == 3
 
-def main(max_pages=None, delay=2):
-    all_listings = []
-    page = 1
-    while True:
-        print(f"== Processing page {page} ==")
-        listings = scrape_page(page)
-        if not listings:
-            print("No listings found, stopping.")
-            break
-        all_listings.extend(listings)
+        _check_selenium_crawl(root, workdir)
 
-        driver = create_driver()
-        driver.get(f"https://batdongsan.com.vn/cho-thue-sang-nhuong-cua-hang-ki-ot-ha-noi/p{page}")
-        time.sleep(2)
+        # Incremental: the id-less card on page 2 is skipped, and a second
+        # crawl stops on page 1 because nothing there is new or changed.
+        store = ListingStore(os.path.join(workdir, "listings.sqlite"))
         try:
-            driver.find_element(By.CSS_SELECTOR, 'a.re__pagination-icon[pid]')
-            has_next = True
-        except NoSuchElementException:
-            has_next = False
-        driver.quit()
-
-        print(f"Next page exists: {has_next}")
-        if not has_next or (max_pages and page >= max_pages):
-            break
-        page += 1
-        time.sleep(delay)
-
-    if all_listings:
-        keys = all_listings[0].keys()
-        with open('kiot_listings.csv', 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=keys)
-            writer.writeheader()
-            writer.writerows(all_listings)
-        print(f"Saved {len(all_listings)} listings to CSV.")
-    else:
-        print("No data scraped.")
+            for _ in range(2):
+                main(delay=0, workers=2, base_url=f"{root}/kiot", output_file=output_file, store=store,
+                     driver_factory=_no_browser)
+            assert sorted(listing["product_id"] for listing in store.listings("kiot")) == ["40223186", "42871483"]
+        finally:
+            store.close()
+    print("Self-check passed.")
+
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Scrape rental listings from batdongsan.com.vn")
+    parser.add_argument("--max-pages", type=int, default=None)
+    parser.add_argument("--category", choices=sorted(CATEGORIES), default="kiot")
+    parser.add_argument("--workers", type=int, default=4, help="number of concurrent fetches / pooled browsers")
+    parser.add_argument("--delay", type=float, default=2)
+    parser.add_argument("--base-url", default=None, help="listing URL without /pN, e.g. a local fixture server")
+    parser.add_argument("--output", default=None, help="output .csv or .jsonl")
+    parser.add_argument("--selenium-only", action="store_true", help="skip the static HTTP fetch")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only upsert new/changed listings and stop at the first fully known page")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="listing store used by --incremental")
+    parser.add_argument("--self-check", action="store_true", help="parse the saved fixture pages and exit")
+    args = parser.parse_args()
+    if args.self_check:
+        self_check()
+        raise SystemExit
+    base_url, output_file = CATEGORIES[args.category]
+    store = ListingStore(args.store) if args.incremental else None
+    try:
+        main(args.max_pages, args.delay, args.workers, args.base_url or base_url, args.output or output_file,
+             static=not args.selenium_only, store=store, category=args.category)
+    finally:
+        if store is not None:
+            store.close()
@@ -0,0 +1,191 @@
+import hashlib
+import inspect
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import filters
+import listing_store
+import listings
+import opening_hours
+from filters import encode_restaurants
+from opening_hours import opening_hours_mask
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow is optional; without it we always parse the CSV
+    feather = None
+
+# Feather schema metadata key holding the SCHEMA_VERSION the file was written with.
+SCHEMA_KEY = b"platewise_schema"
+
+RESTAURANT_COLUMNS = ["name", "address", "latitude", "longitude", "category", "rating", "review_count", "opening_hours", "price_range", "hours_mask"]
+
+EXPECTED_COLUMNS = {
+    "rating": {"type": "numeric", "default": pd.NA},
+    "review_count": {"type": "numeric", "default": 0},
+    "category": {"type": "string", "default": "Unknown"},
+    "opening_hours": {"type": "string", "default": "Unknown"},
+    "price_range": {"type": "string", "default": "Unknown"}
+}
+
+
+def clean_restaurants(df, warn=print):
+    """Schema-normalize a raw restaurant table into RESTAURANT_COLUMNS with compact dtypes."""
+    if "latitude" not in df.columns or "longitude" not in df.columns:
+        raise ValueError("thiếu cột 'latitude' hoặc 'longitude'")
+    df = df.dropna(subset=["latitude", "longitude"]).copy()
+
+    for col, details in EXPECTED_COLUMNS.items():
+        if col not in df.columns:
+            df[col] = details["default"]
+        elif details["type"] == "numeric":
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+            if not pd.isna(details["default"]):
+                df[col] = df[col].fillna(details["default"])
+        elif details["type"] == "string":
+            df[col] = df[col].fillna(details["default"]).astype(str)
+
+    for col in ["name", "address"]:
+        if col not in df.columns:
+            warn(f"Cột '{col}' không có trong tệp, có thể gây lỗi hiển thị.")
+            df[col] = "Missing"
+
+    df["hours_mask"] = opening_hours_mask(df["opening_hours"])
+    df = encode_restaurants(df[RESTAURANT_COLUMNS].reset_index(drop=True))
+    df["latitude"] = df["latitude"].astype(np.float32)
+    df["longitude"] = df["longitude"].astype(np.float32)
+    return df
+
+
+def _schema_version(*parts):
+    # Any change to the cleaning code, the encodings or the expected columns
+    # changes the version, so a Feather file written by older code is rebuilt.
+    sources = [p if isinstance(p, str) else inspect.getsource(p) for p in parts]
+    return hashlib.sha1("\n".join(sources).encode("utf-8")).hexdigest()[:16].encode("ascii")
+
+
+SCHEMA_VERSION = _schema_version(clean_restaurants, filters.encode_restaurants, opening_hours,
+                                 repr(RESTAURANT_COLUMNS), repr(EXPECTED_COLUMNS))
+# Listings are cached after listing_store.read_listings + listings.normalize_listings.
+LISTINGS_SCHEMA_VERSION = _schema_version(listing_store.read_listings, listing_store.parse_images, listings)
+
+
+def columnar_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".feather"
+
+
+def is_fresh(columnar_file, source_file):
+    return (os.path.exists(columnar_file)
+            and os.path.getmtime(columnar_file) >= os.path.getmtime(source_file))
+
+
+def write_columnar(df, path, version=SCHEMA_VERSION):
+    """Uncompressed Feather (Arrow IPC) so reads can memory-map the file."""
+    tmp_path = path + ".tmp"
+    table = pa.Table.from_pandas(df)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), SCHEMA_KEY: version})
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+
+def read_columnar(path, check_schema=False, version=SCHEMA_VERSION):
+    """Memory-mapped read; with check_schema, None if the file was written with another `version`."""
+    table = feather.read_table(path, memory_map=True)
+    if check_schema and (table.schema.metadata or {}).get(SCHEMA_KEY) != version:
+        return None
+    return table.to_pandas()
+
+
+def convert_to_columnar(csv_path, out_path=None, warn=print):
+    if feather is None:
+        raise RuntimeError("pyarrow is required to write Feather files")
+    df = clean_restaurants(pd.read_csv(csv_path), warn=warn)
+    out_path = out_path or columnar_path(csv_path)
+    write_columnar(df, out_path)
+    return out_path
+
+
+def read_restaurants(csv_path, warn=print, refresh=True):
+    """Cleaned restaurant table for csv_path.
+
+    Uses the sibling .feather file when it is at least as new as the CSV
+    and was written by the current cleaning code (SCHEMA_VERSION);
+    otherwise parses and cleans the CSV and, if `refresh`, rewrites the
+    Feather file for the next cold start. Falls back to CSV only when
+    pyarrow is not installed.
+    """
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(csv_path)
+    path = columnar_path(csv_path)
+    if feather is not None and is_fresh(path, csv_path):
+        df = read_columnar(path, check_schema=True)
+        if df is not None:
+            return df
+    df = clean_restaurants(pd.read_csv(csv_path), warn=warn)
+    if feather is not None and refresh:
+        try:
+            write_columnar(df, path)
+        except OSError as e:
+            warn(f"Không thể ghi {path}: {e}")
+    return df
+
+
+def read_listing_table(path, warn=print, refresh=True):
+    """Normalized listings (listings.normalize_listings) for a listings CSV/JSONL.
+
+    Cached in a sibling .feather file exactly like read_restaurants, checked
+    against LISTINGS_SCHEMA_VERSION, so the app skips CSV/JSONL parsing and
+    the per-row images parsing on a warm start.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    columnar_file = columnar_path(path)
+    if feather is not None and is_fresh(columnar_file, path):
+        df = read_columnar(columnar_file, check_schema=True, version=LISTINGS_SCHEMA_VERSION)
+        if df is not None:
+            if "images" in df.columns:
+                df["images"] = df["images"].map(list)  # Arrow lists come back as arrays
+            return df
+    df = listings.normalize_listings(listing_store.read_listings(path))
+    if feather is not None and refresh:
+        try:
+            write_columnar(df, columnar_file, version=LISTINGS_SCHEMA_VERSION)
+        except (OSError, pa.ArrowException) as e:
+            warn(f"Không thể ghi {columnar_file}: {e}")
+    return df
+
+
+def benchmark(csv_path="restaurantsHanoi_augmented.csv", n=1_000_000, workdir="."):
+    base = pd.read_csv(csv_path)
+    big = base.sample(n, replace=True, random_state=0).reset_index(drop=True)
+    big_csv = os.path.join(workdir, f"_bench_{n}.csv")
+    big.to_csv(big_csv, index=False)
+    try:
+        start = time.perf_counter()
+        clean_restaurants(pd.read_csv(big_csv))
+        csv_time = time.perf_counter() - start
+
+        out = convert_to_columnar(big_csv)
+        start = time.perf_counter()
+        df = read_columnar(out)
+        feather_time = time.perf_counter() - start
+        print(f"n={n:,}  csv+clean={csv_time * 1000:.0f} ms  feather(mmap)={feather_time * 1000:.0f} ms  "
+              f"csv={os.path.getsize(big_csv) / 2**20:.1f} MiB  feather={os.path.getsize(out) / 2**20:.1f} MiB")
+        print(df.dtypes.to_string())
+    finally:
+        for path in (big_csv, columnar_path(big_csv)):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        benchmark()
+    else:
+        for csv_file in sys.argv[1:] or ["restaurantsHanoi_augmented.csv"]:
+            print(f"{csv_file} -> {convert_to_columnar(csv_file)}")
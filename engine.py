@@ -0,0 +1,225 @@
+import argparse
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from datastore import read_restaurants
+from filters import filter_mask
+from spatial import GridIndex, nearby
+
+DEFAULT_DATA_FILE = "restaurantsHanoi_augmented.csv"
+DEFAULT_RADIUS_M = 500
+DEFAULT_CHUNK_SIZE = 2000
+
+Filters = namedtuple("Filters", ["categories", "min_rating", "price_ranges", "periods"], defaults=((), 0.0, (), ()))
+Filters.__doc__ = """The sidebar filters; empty/zero values do not filter (see filters.filter_mask)."""
+
+REPORT_COLUMNS = ["restaurants", "competitors", "avg_rating", "rated", "reviews", "nearest_m"]
+# Gazetteer levels precise enough to score a site; a ward or district
+# centroid would count the restaurants around the wrong point.
+SITE_LEVELS = ("address", "street")
+
+
+class SiteEngine:
+    """Radius search and filtering over the restaurant table, without Streamlit.
+
+    app.py runs its searches through one of these; site_report() scores
+    many candidate coordinates with the same logic.
+    """
+
+    def __init__(self, restaurants, cell_size_m=250):
+        self.restaurants = restaurants
+        self.cell_size_m = cell_size_m
+        self.index = GridIndex(restaurants["latitude"], restaurants["longitude"], cell_size_m=cell_size_m)
+        self.rating = pd.to_numeric(restaurants["rating"], errors="coerce").to_numpy(dtype=np.float64)
+        self.reviews = pd.to_numeric(restaurants["review_count"], errors="coerce").to_numpy(dtype=np.float64)
+
+    @classmethod
+    def from_csv(cls, path=DEFAULT_DATA_FILE):
+        return cls(read_restaurants(path, warn=lambda message: None))
+
+    def search(self, lat, lon, radius_m, filters=Filters()):
+        """(filtered rows with a distance column, rows in radius, QueryStats)."""
+        nearby_df, stats = nearby(self.restaurants, self.index, lat, lon, radius_m, return_stats=True)
+        return nearby_df[filter_mask(nearby_df, *filters)], len(nearby_df), stats
+
+    def site_report(self, latitudes, longitudes, radius_m=DEFAULT_RADIUS_M, filters=Filters()):
+        """Per-site counts within `radius_m` as a DataFrame with REPORT_COLUMNS.
+
+        `restaurants` counts everything in the radius; the other columns only
+        restaurants matching `filters` (the competitors). Sites without
+        coordinates get zero counts and NaN averages.
+        """
+        lat = np.asarray(latitudes, dtype=np.float64)
+        lon = np.asarray(longitudes, dtype=np.float64)
+        matching = np.flatnonzero(filter_mask(self.restaurants, *filters))
+        # A second index over the competitors only, so most sites never touch the rest.
+        competitor_index = GridIndex(self.index.lat[matching], self.index.lon[matching],
+                                     cell_size_m=self.cell_size_m)
+        rating, reviews = self.rating[matching], self.reviews[matching]
+
+        out = {name: np.zeros(len(lat)) for name in REPORT_COLUMNS}
+        out["avg_rating"][:] = out["nearest_m"][:] = np.nan
+        for i in np.flatnonzero(~(np.isnan(lat) | np.isnan(lon))):
+            out["restaurants"][i] = len(self.index.query_radius(lat[i], lon[i], radius_m)[0])
+            indices, dist = competitor_index.query_radius(lat[i], lon[i], radius_m)
+            if not len(indices):
+                continue
+            site_rating = rating[indices]
+            rated = site_rating[~np.isnan(site_rating)]
+            out["competitors"][i] = len(indices)
+            out["rated"][i] = len(rated)
+            out["avg_rating"][i] = rated.mean() if len(rated) else np.nan
+            out["reviews"][i] = np.nansum(reviews[indices])
+            out["nearest_m"][i] = dist.min()
+
+        report = pd.DataFrame(out)
+        for name in ("restaurants", "competitors", "rated", "reviews"):
+            report[name] = report[name].astype(np.int64)
+        report["avg_rating"] = report["avg_rating"].round(2)
+        report["nearest_m"] = report["nearest_m"].round(1)
+        return report
+
+
+_worker_engine = None
+
+
+def _engine(restaurants):
+    if isinstance(restaurants, SiteEngine):
+        return restaurants
+    return SiteEngine.from_csv(restaurants) if isinstance(restaurants, str) else SiteEngine(restaurants)
+
+
+def _init_worker(restaurants):
+    global _worker_engine
+    _worker_engine = _engine(restaurants)
+
+
+def _report_chunk(latitudes, longitudes, radius_m, filters):
+    return _worker_engine.site_report(latitudes, longitudes, radius_m, filters)
+
+
+def site_report(sites, radius_m=DEFAULT_RADIUS_M, filters=Filters(), restaurants=DEFAULT_DATA_FILE,
+                workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Score candidate sites: `sites` with latitude/longitude columns plus REPORT_COLUMNS.
+
+    `restaurants` is a data file path, a cleaned restaurant table or a
+    SiteEngine. With workers > 1 the sites are split into chunks scored in
+    a process pool; each worker builds its own engine once (from the path,
+    or from a pickled copy of the table).
+    """
+    lat = sites["latitude"].to_numpy(dtype=np.float64)
+    lon = sites["longitude"].to_numpy(dtype=np.float64)
+    if workers <= 1 or len(sites) <= chunk_size:
+        report = _engine(restaurants).site_report(lat, lon, radius_m, filters)
+    else:
+        source = restaurants.restaurants if isinstance(restaurants, SiteEngine) else restaurants
+        bounds = range(0, len(sites), chunk_size)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(source,)) as executor:
+            chunks = executor.map(_report_chunk, [lat[i:i + chunk_size] for i in bounds],
+                                  [lon[i:i + chunk_size] for i in bounds],
+                                  [radius_m] * len(bounds), [filters] * len(bounds))
+            report = pd.concat(list(chunks), ignore_index=True)
+    report.index = sites.index
+    return pd.concat([sites, report], axis=1)
+
+
+def _geocoded_listings(path):
+    """{product_id: (latitude, longitude)} from listings.py --geocode output, or {} without it."""
+    if not os.path.exists(path):
+        return {}
+    df = pd.read_csv(path, encoding="utf-8-sig", dtype={"product_id": str})
+    if not {"product_id", "Latitude", "Longitude"} <= set(df.columns):
+        return {}
+    df = df.dropna(subset=["product_id", "Latitude", "Longitude"]).drop_duplicates("product_id")
+    return dict(zip(df["product_id"], zip(df["Latitude"], df["Longitude"])))
+
+
+def candidate_sites(path, address_column=None, geocoded_file=None, levels=SITE_LEVELS):
+    """Candidate sites from a CSV: its latitude/longitude columns (any case), or
+    else `address_column` resolved through the offline gazetteer.
+
+    Listings with a product_id take their coordinates from `geocoded_file`
+    (listings.py --geocode, default listings_geocoded.csv) when it has them;
+    their geocode_level is "geocoded". Other sites get the gazetteer level of
+    their address text, and keep NaN coordinates when it is not in `levels`.
+    """
+    df = pd.read_csv(path, encoding="utf-8-sig", dtype={"product_id": str})
+    columns = {c.lower(): c for c in df.columns}
+    if "latitude" in columns and "longitude" in columns:
+        df = df.rename(columns={columns["latitude"]: "latitude", columns["longitude"]: "longitude"})
+        df[["latitude", "longitude"]] = df[["latitude", "longitude"]].apply(pd.to_numeric, errors="coerce")
+        return df
+    from gazetteer import Gazetteer
+    from listings import GEOCODED_LISTINGS_FILE
+
+    address_column = address_column or next((columns[c] for c in ("address", "location") if c in columns), None)
+    if address_column is None:
+        raise ValueError(f"{path} has neither latitude/longitude nor an address/location column")
+    gazetteer = Gazetteer.from_csv()
+    lookups = [gazetteer.lookup(a) if isinstance(a, str) else (None, None) for a in df[address_column]]
+    df["geocode_level"] = ["district" if level == "street" and gazetteer.is_district(a) else level
+                           for a, (_, level) in zip(df[address_column], lookups)]
+    df["latitude"] = [r.latitude if r else np.nan for r, _ in lookups]
+    df["longitude"] = [r.longitude if r else np.nan for r, _ in lookups]
+    geocoded = _geocoded_listings(geocoded_file or GEOCODED_LISTINGS_FILE) if "product_id" in df.columns else {}
+    known = df["product_id"].isin(geocoded.keys()).to_numpy() if geocoded else np.zeros(len(df), dtype=bool)
+    df.loc[~known & ~df["geocode_level"].isin(levels), ["latitude", "longitude"]] = np.nan
+    if known.any():
+        df.loc[known, ["latitude", "longitude"]] = [geocoded[p] for p in df.loc[known, "product_id"]]
+        df.loc[known, "geocode_level"] = "geocoded"
+    return df
+
+
+def benchmark(n=10_000, radius_m=DEFAULT_RADIUS_M, workers=(1, 4)):
+    from spatial import synthetic_points
+
+    sites = synthetic_points(n, seed=1)
+    engine = SiteEngine.from_csv()
+    filters = Filters(categories=("Phở", "Bún Chả", "Nhà hàng Việt"), min_rating=4.0)
+    for w in workers:
+        start = time.perf_counter()
+        report = site_report(sites, radius_m, filters, engine if w == 1 else DEFAULT_DATA_FILE, workers=w)
+        print(f"n={n:,} workers={w}  {(time.perf_counter() - start) * 1000:.0f} ms  "
+              f"sites with competitors={int((report['competitors'] > 0).sum())}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Competitor report for candidate sites")
+    parser.add_argument("sites", nargs="?", help="CSV with latitude/longitude or address/location columns")
+    parser.add_argument("--output", default=None, help="output CSV (default: <sites>_report.csv)")
+    parser.add_argument("--data", default=DEFAULT_DATA_FILE, help="restaurant data file")
+    parser.add_argument("--radius", type=float, default=DEFAULT_RADIUS_M, help="radius in meters")
+    parser.add_argument("--category", action="append", default=[], help="competitor category (repeatable)")
+    parser.add_argument("--min-rating", type=float, default=0.0)
+    parser.add_argument("--price-range", action="append", default=[], help="price_range label (repeatable)")
+    parser.add_argument("--period", action="append", default=[], help="opening-hours period label (repeatable)")
+    parser.add_argument("--address-column", default=None)
+    parser.add_argument("--any-level", action="store_true",
+                        help="also score sites only located to a ward or district centroid")
+    parser.add_argument("--workers", type=int, default=1, help="process pool size")
+    parser.add_argument("--benchmark", action="store_true")
+    args = parser.parse_args()
+    if args.benchmark or not args.sites:
+        benchmark()
+        sys.exit()
+    from gazetteer import LEVELS
+
+    sites = candidate_sites(args.sites, args.address_column, levels=LEVELS if args.any_level else SITE_LEVELS)
+    filters = Filters(tuple(args.category), args.min_rating, tuple(args.price_range), tuple(args.period))
+    start = time.perf_counter()
+    report = site_report(sites, args.radius, filters, args.data, workers=args.workers)
+    output = args.output or f"{os.path.splitext(args.sites)[0]}_report.csv"
+    report.to_csv(output, index=False, encoding="utf-8-sig")
+    located = int(sites["latitude"].notna().sum())
+    print(f"Scored {located}/{len(sites)} sites in {time.perf_counter() - start:.2f}s; saved to {output}")
+    if "geocode_level" in sites.columns:
+        levels = sites["geocode_level"].fillna("miss").value_counts()
+        print("Geocode levels: " + ", ".join(f"{level} {count}" for level, count in levels.items())
+              + ("" if args.any_level else f" (gazetteer sites are only scored at {'/'.join(SITE_LEVELS)} level;"
+                                           " see --any-level)"))
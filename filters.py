@@ -0,0 +1,87 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from opening_hours import PERIOD_LABELS, matches_periods, opening_hours_mask
+
+CATEGORICAL_COLUMNS = ["category", "price_range"]
+
+
+def encode_restaurants(df):
+    """Compact dtypes for filtering: categoricals for labels, float32 rating/review_count."""
+    df = df.copy()
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    if "rating" in df.columns:
+        df["rating"] = pd.to_numeric(df["rating"], errors="coerce").astype(np.float32)
+    if "review_count" in df.columns:
+        df["review_count"] = pd.to_numeric(df["review_count"], errors="coerce").astype(np.float32)
+    return df
+
+
+def _isin(series, values):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.categories.get_indexer(list(values))
+        return np.isin(series.cat.codes.to_numpy(), codes[codes >= 0])
+    return series.isin(values).to_numpy()
+
+
+def filter_mask(df, categories=(), min_rating=0.0, price_ranges=(), periods=()):
+    """One boolean array combining every sidebar filter; apply it with df[mask] once."""
+    mask = np.ones(len(df), dtype=bool)
+    if categories and "category" in df.columns:
+        mask &= _isin(df["category"], categories)
+    if min_rating > 0.0 and "rating" in df.columns:
+        rating = df["rating"].to_numpy(dtype=np.float32, na_value=np.nan)
+        # Compare in float32 so a 4.2 slider value keeps rows rated 4.2.
+        mask &= rating >= np.float32(min_rating)
+    if price_ranges and "price_range" in df.columns:
+        mask &= _isin(df["price_range"], price_ranges)
+    if periods and "hours_mask" in df.columns:
+        mask &= matches_periods(df["hours_mask"], periods)
+    return mask
+
+
+def _chained_filters(df, categories, min_rating, price_ranges, periods):
+    # The per-filter copies app.py used to make, kept as a benchmark baseline.
+    temp_df = df.copy()
+    if categories:
+        temp_df = temp_df[temp_df["category"].isin(categories)]
+    if min_rating > 0.0:
+        temp_df["rating"] = pd.to_numeric(temp_df["rating"], errors='coerce')
+        temp_df = temp_df[temp_df["rating"].notna() & (temp_df["rating"] >= min_rating)]
+    if price_ranges:
+        temp_df = temp_df[temp_df["price_range"].isin(price_ranges)]
+    if periods:
+        temp_df = temp_df[matches_periods(temp_df["hours_mask"], periods)]
+    return temp_df
+
+
+def benchmark(path="restaurantsHanoi_augmented.csv", sizes=(1_000, 100_000, 1_000_000), repeat=5):
+    base = pd.read_csv(path)
+    base["hours_mask"] = opening_hours_mask(base["opening_hours"])
+    args = (["Phở", "Bún Chả", "Cà phê"], 4.2, ["Bình dân (<100k)", "Trung bình (100k-300k)"], PERIOD_LABELS[1:2])
+    for n in sizes:
+        raw = base.sample(n, replace=True, random_state=0).reset_index(drop=True)
+        raw = raw.astype({"category": object, "price_range": object})
+        encoded = encode_restaurants(raw)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            chained = _chained_filters(raw, *args)
+        old = (time.perf_counter() - start) / repeat
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            masked = encoded[filter_mask(encoded, *args)]
+        new = (time.perf_counter() - start) / repeat
+
+        assert len(chained) == len(masked)
+        print(f"n={n:>9,}  chained={old * 1000:8.2f} ms  mask={new * 1000:8.2f} ms  "
+              f"speedup={old / new:5.1f}x  rows={len(masked)}")
+
+
+if __name__ == "__main__":
+    benchmark()
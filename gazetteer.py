@@ -0,0 +1,278 @@
+import bisect
+import difflib
+import os
+import re
+import sys
+import time
+import unicodedata
+from collections import namedtuple
+
+import pandas as pd
+
+from addresses import CITY, canonical_address
+from geocoding import GeocodeResult
+
+SOURCES = ["restaurantsHANOI_google_geocoded.csv", "restaurantsHanoi_cleaned.csv"]
+# A provider's own earlier output only: a batch run for one provider must not
+# copy another provider's coordinates, or reconcile.py compares them to themselves.
+PROVIDER_SOURCES = {
+    "google": ["restaurantsHANOI_google_geocoded.csv", "restaurantsOCEANPARK_google_geocoded.csv"],
+    "nominatim": ["restaurantsOCEANPARK.csv", "restaurantsOCEANPARK_geocoded_new.csv"],
+}
+
+LEVELS = ("address", "street", "ward", "district")
+
+Place = namedtuple("Place", ["latitude", "longitude", "name", "count"])
+
+# Leading house numbers, alleys and floors: "34 Ngách 36 Ngõ 28 Xuân La" -> "Xuân La".
+_HOUSE_NUMBER = re.compile(r"^(?:(?:số nhà|số|tầng|ngõ|ngách|hẻm|kiốt|kiot|lô|nhà|phòng)\s*)?[\w./-]*\d[\w./-]*\s+", re.IGNORECASE)
+_STREET_PREFIX = re.compile(r"^(?:phố|đường)\s+", re.IGNORECASE)
+_WARD_PREFIX = re.compile(r"^(?:Phường|Xã|Thị trấn)\s+")
+
+
+def fold(text):
+    """Accent- and case-insensitive form: "Đống Đa" -> "dong da"."""
+    text = unicodedata.normalize("NFD", text.replace("Đ", "D").replace("đ", "d"))
+    return "".join(c for c in text if not unicodedata.combining(c)).casefold()
+
+
+def street_name(component):
+    """First address component without house/alley numbers; None if nothing is left."""
+    previous = None
+    while component != previous:
+        previous, component = component, _HOUSE_NUMBER.sub("", component, count=1)
+    component = component.strip()
+    return component if component and not component[0].isdigit() else None
+
+
+def split_address(address):
+    """(first component, street, ward, district) of an address; parts may be None."""
+    canonical = canonical_address(address)
+    if not canonical:
+        return None, None, None, None
+    parts = canonical.split(", ")
+    if parts[-1] == CITY:
+        parts = parts[:-1]
+    if not parts:
+        return None, None, None, None
+    ward = next((p for p in parts if _WARD_PREFIX.match(p)), None)
+    district = parts[-1] if len(parts) > 1 and parts[-1] != ward else None
+    return parts[0], street_name(parts[0]), ward, district
+
+
+def district_of(addresses):
+    """District of each address (split_address) as a string Series; <NA> when it names none.
+
+    "98 Trần Nhật Duật, Q. Hoàn Kiếm, Hà Nội, Việt Nam" -> "Hoàn Kiếm".
+    """
+    addresses = pd.Series(addresses)
+    districts = {a: split_address(a)[3] for a in addresses.dropna().unique() if isinstance(a, str)}
+    return addresses.map(districts).astype("string")
+
+
+def _result(place):
+    name = place.name if place.name.endswith(CITY) else f"{place.name}, {CITY}"
+    return GeocodeResult(place.latitude, place.longitude, name)
+
+
+def _key(text):
+    return _STREET_PREFIX.sub("", text).casefold()
+
+
+class Gazetteer:
+    """In-process lookup of Hanoi addresses from coordinates we already have.
+
+    Resolves, in order: exact address, house number + street (within the
+    query's district; without one the match is only "street" level, since the
+    same house number and street exist in several districts), street (within
+    the query's district when given), ward, district; then a prefix match and
+    finally a fuzzy match on place names. Matching ignores case and, as a
+    fallback, diacritics. Lookups are dictionary hits, well under a millisecond.
+    """
+
+    def __init__(self, addresses, latitudes, longitudes):
+        points = pd.DataFrame({"address": list(addresses),
+                               "latitude": pd.to_numeric(pd.Series(list(latitudes)), errors="coerce"),
+                               "longitude": pd.to_numeric(pd.Series(list(longitudes)), errors="coerce")})
+        points = points.dropna().drop_duplicates()
+        parts = pd.DataFrame([split_address(a) for a in points["address"]],
+                             columns=["house", "street", "ward", "district"], index=points.index)
+        points = points.join(parts)
+        points["exact"] = [canonical_address(a).casefold() for a in points["address"]]
+
+        self._index = {
+            "exact": self._places(points, "exact", "address", key=str),
+            "house_district": self._places(points, ["house", "district"], "house", key=str.casefold),
+            "house": self._places(points, "house", "house", key=str.casefold),
+            "street_district": self._places(points, ["street", "district"], "street"),
+            "street": self._places(points[points["district"].isna()], "street", "street"),
+            "ward": self._places(points, "ward", "ward"),
+            "district": self._places(points, "district", "district"),
+        }
+        # Streets with the same name exist in several districts (Trần Nhật Duật
+        # in Hoàn Kiếm and Hà Đông); without a district, use the busiest one.
+        for (street, _), place in self._index["street_district"].items():
+            known = self._index["street"].get(street)
+            if known is None or known.count < place.count:
+                self._index["street"][street] = place
+        self._folded = {name: {fold(k) if isinstance(k, str) else tuple(map(fold, k)): k for k in index}
+                        for name, index in self._index.items()}
+        names = [(fold(place.name), level, key) for level in ("street", "ward", "district")
+                 for key, place in self._index[level].items()]
+        self._names = sorted(names)
+        self._name_keys = [name for name, _, _ in self._names]
+        self._by_initial = {}
+        for name in self._name_keys:
+            self._by_initial.setdefault(name[:1], []).append(name)
+        self.size = len(points)
+
+    @staticmethod
+    def _places(points, by, label, key=_key):
+        groups = points.dropna(subset=[by] if isinstance(by, str) else by).groupby(by, sort=False)
+        stats = groups.agg(latitude=("latitude", "mean"), longitude=("longitude", "mean"),
+                           name=(label, "first"), count=("latitude", "size"))
+        places = {}
+        for index, row in zip(stats.index, stats.itertuples(index=False)):
+            k = key(index) if isinstance(index, str) else tuple(key(i) for i in index)
+            if k not in places or places[k].count < row.count:
+                places[k] = Place(*row)
+        return places
+
+    @classmethod
+    def from_csv(cls, paths=SOURCES):
+        """Build from geocoded CSVs with address/latitude/longitude columns (any case); missing files are skipped."""
+        frames = [pd.DataFrame(columns=["address", "latitude", "longitude"])]
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            df = pd.read_csv(path, encoding="utf-8-sig")
+            df.columns = [c.lower() for c in df.columns]
+            frames.append(df[["address", "latitude", "longitude"]])
+        df = pd.concat(frames, ignore_index=True)
+        return cls(df["address"], df["latitude"], df["longitude"])
+
+    def _get(self, index, key):
+        place = self._index[index].get(key)
+        if place is None:
+            folded = fold(key) if isinstance(key, str) else tuple(map(fold, key))
+            original = self._folded[index].get(folded)
+            place = self._index[index][original] if original is not None else None
+        return place
+
+    def lookup(self, query):
+        """(GeocodeResult, level) for a free-text query, or (None, None)."""
+        canonical = canonical_address(query)
+        if not canonical:
+            return None, None
+        house, street, ward, district = split_address(query)
+        street_key = _key(street) if street else None
+        house_key = house.casefold() if house and house != street else None
+        candidates = [
+            ("address", "exact", canonical.casefold()),
+            ("address", "house_district", (house_key, district.casefold()) if house_key and district else None),
+            ("street", "house", house_key if not district else None),
+            ("street", "street_district", (street_key, _key(district)) if street_key and district else None),
+            ("street", "street", street_key),
+            ("ward", "ward", _key(ward) if ward else None),
+            ("district", "district", _key(district) if district else None),
+            # A bare district name ("Cầu Giấy") is parsed as a street.
+            ("district", "district", _key(house) if house else None),
+        ]
+        for level, index, key in candidates:
+            if key is None:
+                continue
+            place = self._get(index, key)
+            if place is not None:
+                return _result(place), level
+        if house:
+            place, level = self._fuzzy(fold(street or house))
+            if place is not None:
+                return _result(place), level
+        return None, None
+
+    def __call__(self, query):
+        return self.lookup(query)[0]
+
+    def is_district(self, query):
+        """True when the query is only a district name ("Hoàng Mai, Hà Nội"), which
+        lookup() resolves to the street of the same name when there is one."""
+        house, _, ward, district = split_address(query)
+        return bool(house) and ward is None and district is None and self._get("district", _key(house)) is not None
+
+    def _prefix_matches(self, prefix):
+        start = bisect.bisect_left(self._name_keys, prefix)
+        end = bisect.bisect_left(self._name_keys, prefix + "\uffff")
+        return self._names[start:end]
+
+    def _fuzzy(self, folded):
+        if len(folded) >= 3:
+            matches = self._prefix_matches(folded)
+            if matches:
+                _, level, key = max(matches, key=lambda m: self._index[m[1]][m[2]].count)
+                return self._index[level][key], level
+        # Only names with the same initial, to keep misses cheap.
+        close = difflib.get_close_matches(folded, self._by_initial.get(folded[:1], []), n=1, cutoff=0.85)
+        if close:
+            _, level, key = self._names[bisect.bisect_left(self._name_keys, close[0])]
+            return self._index[level][key], level
+        return None, None
+
+    def suggest(self, prefix, limit=10):
+        """Place names starting with `prefix` (diacritics optional), most common first; all names for ""."""
+        matches = self._prefix_matches(fold(prefix.strip()))
+        places = sorted((self._index[level][key] for _, level, key in matches), key=lambda p: -p.count)
+        return [place.name for place in places[:limit]]
+
+
+class TieredGeocoder:
+    """Geocode function that tries the gazetteer first and `fallback` only on a miss.
+
+    `accept` limits which gazetteer levels count as a hit; batch scripts use
+    ("address",) so rows are never placed at a street or district centroid.
+    source(address) tells where a found result came from: "gazetteer:<level>"
+    or the fallback's provider name.
+    """
+
+    def __init__(self, gazetteer, fallback, accept=LEVELS):
+        self.gazetteer = gazetteer
+        self.fallback = fallback
+        self.accept = set(accept)
+        self.local_hits = 0
+        self.fallbacks = 0
+        self._sources = {}
+
+    def __call__(self, address):
+        result, level = self.gazetteer.lookup(address)
+        if result is not None and level in self.accept:
+            self.local_hits += 1
+            self._sources[address] = f"gazetteer:{level}"
+            return result
+        self.fallbacks += 1
+        result = self.fallback(address)
+        if result is not None:
+            self._sources[address] = getattr(self.fallback, "provider", "fallback")
+        return result
+
+    def source(self, address):
+        return self._sources.get(address)
+
+
+BENCHMARK_QUERIES = ["98 Trần Nhật Duật, Hoàn Kiếm", "98 Trần Nhật Duật, Hà Đông", "Trần Nhật Duật", "tran nhat duat", "Cầu Giấy",
+                     "P. Xuân La, Tây Hồ", "Hoàng Quốc Vit", "Nguyễn Thượng", "Không có phố này"]
+
+
+def benchmark(queries=BENCHMARK_QUERIES, repeat=1000):
+    start = time.perf_counter()
+    gazetteer = Gazetteer.from_csv()
+    print(f"built from {gazetteer.size} points in {(time.perf_counter() - start) * 1000:.0f} ms")
+    for query in queries:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result, level = gazetteer.lookup(query)
+        elapsed = (time.perf_counter() - start) / repeat
+        where = f"{result.address} ({result.latitude:.5f}, {result.longitude:.5f})" if result else "-"
+        print(f"{query!r:>36} -> {level or 'miss':<8} {elapsed * 1e6:7.1f} µs  {where}")
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1:] or BENCHMARK_QUERIES)
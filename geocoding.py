@@ -0,0 +1,190 @@
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+
+from geopy.extra.rate_limiter import RateLimiter
+
+GeocodeResult = namedtuple("GeocodeResult", ["latitude", "longitude", "address"])
+
+DEFAULT_CACHE_PATH = "geocode_cache.sqlite"
+DEFAULT_TTL = 90 * 24 * 3600
+DEFAULT_NEGATIVE_TTL = 7 * 24 * 3600
+
+# requests/second and burst size per provider; Nominatim's usage policy caps
+# clients at one request per second, Google allows 50 QPS per project.
+PROVIDER_RATE_LIMITS = {
+    "nominatim": (1.0, 1),
+    "google": (50.0, 10),
+}
+
+MISS = object()
+
+
+def normalize_address(address):
+    """Cache key for an address: NFC, trimmed, single-spaced and casefolded."""
+    address = unicodedata.normalize("NFC", str(address))
+    return re.sub(r"\s+", " ", address).strip().casefold()
+
+
+class GeocodeCache:
+    """SQLite-backed geocode cache keyed on (provider, normalized address).
+
+    Failed lookups ("not found") are cached too, with their own, shorter TTL.
+    The connection is shared between threads behind a lock.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                " provider TEXT NOT NULL,"
+                " query TEXT NOT NULL,"
+                " latitude REAL,"
+                " longitude REAL,"
+                " address TEXT,"
+                " found INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " PRIMARY KEY (provider, query))"
+            )
+
+    def get(self, provider, address):
+        """Cached GeocodeResult, None for a cached miss, or MISS if absent/expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT latitude, longitude, address, found, created FROM geocode WHERE provider = ? AND query = ?",
+                (provider, normalize_address(address)),
+            ).fetchone()
+        if row is None:
+            return MISS
+        latitude, longitude, resolved, found, created = row
+        ttl = self.ttl if found else self.negative_ttl
+        if ttl is not None and time.time() - created > ttl:
+            return MISS
+        return GeocodeResult(latitude, longitude, resolved) if found else None
+
+    def set(self, provider, address, result):
+        if result is None:
+            values = (None, None, None, 0)
+        else:
+            values = (result.latitude, result.longitude, result.address, 1)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (provider, normalize_address(address), *values, time.time()),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `capacity` banked."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def provider_limiter(provider, rate=None, capacity=None):
+    default_rate, default_capacity = PROVIDER_RATE_LIMITS.get(provider, (1.0, 1))
+    return TokenBucket(rate or default_rate, capacity or default_capacity)
+
+
+class CachedGeocoder:
+    """Callable address -> GeocodeResult | None that consults the cache first.
+
+    `geocode_fn` is only called on a cache miss, so provider rate limiting
+    wrapped around it (or an optional shared `limiter`) costs nothing for
+    addresses seen before. Exceptions are not cached and propagate to the
+    caller.
+    """
+
+    def __init__(self, provider, geocode_fn, cache=None, limiter=None):
+        self.provider = provider
+        self.geocode_fn = geocode_fn
+        self.cache = cache if cache is not None else GeocodeCache()
+        self.limiter = limiter
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, address):
+        cached = self.cache.get(self.provider, address)
+        if cached is not MISS:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        if self.limiter is not None:
+            self.limiter.acquire()
+        result = self.geocode_fn(address)
+        self.cache.set(self.provider, address, result)
+        return result
+
+
+def nominatim_geocoder(user_agent, cache=None, min_delay_seconds=1, timeout=10, limiter=None, **rate_limiter_kwargs):
+    """Cached Nominatim lookup.
+
+    Without `limiter` calls go through geopy's RateLimiter (sequential use);
+    pass a TokenBucket to share one provider budget between worker threads.
+    """
+    from geopy.geocoders import Nominatim
+
+    geolocator = Nominatim(user_agent=user_agent)
+    if limiter is None:
+        rate_limiter_kwargs.setdefault("swallow_exceptions", False)
+        geocode = RateLimiter(geolocator.geocode, min_delay_seconds=min_delay_seconds, **rate_limiter_kwargs)
+    else:
+        geocode = geolocator.geocode
+
+    def lookup(address):
+        location = geocode(address, timeout=timeout)
+        if location:
+            return GeocodeResult(location.latitude, location.longitude, location.address)
+        return None
+
+    return CachedGeocoder("nominatim", lookup, cache, limiter)
+
+
+def google_geocoder(api_key, cache=None, min_delay_seconds=0.1, limiter=None, **rate_limiter_kwargs):
+    """Cached Google Maps lookup; `limiter` works as for nominatim_geocoder."""
+    import googlemaps
+
+    gmaps = googlemaps.Client(key=api_key)
+    if limiter is None:
+        rate_limiter_kwargs.setdefault("max_retries", 0)
+        rate_limiter_kwargs.setdefault("swallow_exceptions", False)
+        geocode = RateLimiter(gmaps.geocode, min_delay_seconds=min_delay_seconds, **rate_limiter_kwargs)
+    else:
+        geocode = gmaps.geocode
+
+    def lookup(address):
+        geocode_result = geocode(address)
+        if geocode_result and len(geocode_result) > 0:
+            location = geocode_result[0]["geometry"]["location"]
+            return GeocodeResult(location["lat"], location["lng"], geocode_result[0].get("formatted_address"))
+        return None
+
+    return CachedGeocoder("google", lookup, cache, limiter)
@@ -0,0 +1,181 @@
+import ast
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+DEFAULT_STORE_PATH = "listings.sqlite"
+
+LISTING_FIELDS = ['product_id', 'title', 'url', 'images', 'price', 'area', 'toilet', 'location', 'description', 'published']
+
+# "published" is relative ("Đăng hôm nay") and changes daily without the listing changing.
+VOLATILE_FIELDS = {"published"}
+
+
+def content_hash(listing):
+    stable = {k: v for k, v in listing.items() if k not in VOLATILE_FIELDS}
+    return hashlib.sha1(json.dumps(stable, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def with_product_id(listings):
+    """Listings that can be stored; cards without a product_id are dropped with a warning."""
+    kept = [listing for listing in listings if listing.get("product_id")]
+    if len(kept) < len(listings):
+        print(f"  Skipping {len(listings) - len(kept)} listings without product_id")
+    return kept
+
+
+class ListingStore:
+    """Known listings per category, keyed by product_id, with a content hash for change detection."""
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS listings ("
+                " category TEXT NOT NULL,"
+                " product_id TEXT NOT NULL,"
+                " content_hash TEXT NOT NULL,"
+                " data TEXT NOT NULL,"
+                " first_seen REAL NOT NULL,"
+                " last_seen REAL NOT NULL,"
+                " PRIMARY KEY (category, product_id))"
+            )
+
+    def classify(self, category, listings):
+        """Split listings into (new, changed, unchanged) against the store; listings without an id are skipped."""
+        listings = with_product_id(listings)
+        ids = [listing["product_id"] for listing in listings]
+        known = {}
+        if ids:
+            placeholders = ",".join("?" * len(ids))
+            known = dict(self._conn.execute(
+                f"SELECT product_id, content_hash FROM listings WHERE category = ? AND product_id IN ({placeholders})",
+                (category, *ids),
+            ).fetchall())
+        new, changed, unchanged = [], [], []
+        for listing in listings:
+            stored = known.get(listing["product_id"])
+            if stored is None:
+                new.append(listing)
+            elif stored != content_hash(listing):
+                changed.append(listing)
+            else:
+                unchanged.append(listing)
+        return new, changed, unchanged
+
+    def upsert(self, category, listings):
+        listings = with_product_id(listings)
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO listings VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (category, product_id) DO UPDATE SET "
+                " content_hash = excluded.content_hash, data = excluded.data, last_seen = excluded.last_seen",
+                [(category, listing["product_id"], content_hash(listing),
+                  json.dumps(listing, ensure_ascii=False), now, now) for listing in listings],
+            )
+
+    def touch(self, category, listings):
+        """Mark unchanged listings as seen in this crawl."""
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE listings SET last_seen = ? WHERE category = ? AND product_id = ?",
+                [(time.time(), category, listing["product_id"]) for listing in listings],
+            )
+
+    def listings(self, category):
+        rows = self._conn.execute(
+            "SELECT data FROM listings WHERE category = ? ORDER BY first_seen DESC, product_id", (category,)
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    def export(self, category, output_file):
+        listings = self.listings(category)
+        if listings:
+            with ListingSink(output_file) as sink:
+                sink.write_page(listings)
+        return len(listings)
+
+    def close(self):
+        self._conn.close()
+
+
+class ListingSink:
+    """Streams scraped listings to CSV or JSONL (by extension), flushing after every page.
+
+    The file is only opened (and an existing one replaced) by the first
+    non-empty page, so a crawl that fetches nothing leaves the previous
+    output alone. After that it is valid after each write_page(), so a
+    crashed crawl leaves a usable partial result. In CSV the images list is
+    stored as a JSON array.
+    """
+
+    def __init__(self, path, fieldnames=LISTING_FIELDS):
+        self.path = path
+        self.jsonl = os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson")
+        self.fieldnames = fieldnames
+        self.count = 0
+        self._file = None
+
+    def _open(self):
+        self._file = open(self.path, 'w', newline='', encoding='utf-8')
+        if not self.jsonl:
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, extrasaction='ignore')
+            self._writer.writeheader()
+
+    def write_page(self, listings):
+        if not listings:
+            return
+        if self._file is None:
+            self._open()
+        for listing in listings:
+            if self.jsonl:
+                self._file.write(json.dumps(listing, ensure_ascii=False) + "\n")
+            else:
+                row = dict(listing, images=json.dumps(listing.get('images') or [], ensure_ascii=False))
+                self._writer.writerow(row)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.count += len(listings)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_images(value):
+    """images cell -> list; accepts JSON arrays and the older Python-repr lists."""
+    if isinstance(value, list):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        return []
+    try:
+        return json.loads(value)
+    except ValueError:
+        try:
+            return list(ast.literal_eval(value))
+        except (ValueError, SyntaxError):
+            return []
+
+
+def read_listings(path):
+    """Load a listings CSV or JSONL (possibly from an unfinished crawl) into a DataFrame."""
+    if os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson"):
+        df = pd.read_json(path, lines=True, dtype={"product_id": str})
+    else:
+        df = pd.read_csv(path, dtype={"product_id": str})
+    if "images" in df.columns:
+        df["images"] = df["images"].map(parse_images)
+    return df
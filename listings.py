@@ -0,0 +1,132 @@
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from listing_store import read_listings
+
+UNIT_MULTIPLIERS = {"tỷ": 1e9, "triệu": 1e6, "nghìn": 1e3, "ngàn": 1e3, "đồng": 1.0, "đ": 1.0}
+
+_PRICE = r"(?P<amount>\d[\d.,]*)\s*(?P<unit>tỷ|triệu|nghìn|ngàn|đồng|đ)?\s*(?P<per_m2>/\s*m(?:²|2))?"
+_NUMBER = r"(\d[\d.,]*)"
+
+LISTING_FILES = ["kiot_listings.csv", "shophouse_listings.csv", "ocean.csv"]
+GEOCODED_LISTINGS_FILE = "listings_geocoded.csv"
+
+
+def _on_uniques(series, parse):
+    """Apply a vectorized parser to the distinct values only, then broadcast back.
+
+    Scraped prices/areas repeat heavily ("25 triệu/tháng"), so this keeps
+    the regex work proportional to the number of distinct strings.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    parsed = parse(pd.Series(uniques, dtype=object).astype("string"))
+    parsed = pd.concat([parsed, parsed.iloc[:0].reindex([len(parsed)])])  # row for NaN (code -1)
+    result = parsed.iloc[np.where(codes < 0, len(uniques), codes)]
+    result.index = series.index
+    return result
+
+
+def parse_vn_number(strings):
+    """Vietnamese-formatted numbers ("1.900", "10,5") -> float Series.
+
+    A dot followed by exactly three digits is a thousands separator, a
+    comma is the decimal mark; "70.0" (pandas float written as text) is
+    left alone.
+    """
+    strings = strings.str.replace(r"\.(?=\d{3}(?!\d))", "", regex=True)
+    return pd.to_numeric(strings.str.replace(",", ".", regex=False), errors="coerce").astype(float)
+
+
+def parse_area(area):
+    """"70 m²", "·120 m²", "50", 70.0 -> square meters (float)."""
+    if pd.api.types.is_numeric_dtype(area):
+        return area.astype(float)
+    return _on_uniques(area, lambda s: parse_vn_number(s.str.extract(_NUMBER, expand=False)))
+
+
+def parse_price(price):
+    """Price strings -> DataFrame(amount_vnd, per_m2); "Giá thỏa thuận" gives NaN.
+
+    Amounts are VND per month as listed; per_m2 marks "…/m²" quotes that
+    still need multiplying by the area.
+    """
+    def parse(strings):
+        parts = strings.str.casefold().str.extract(_PRICE)
+        multiplier = parts["unit"].map(UNIT_MULTIPLIERS).astype(float).fillna(1.0)
+        return pd.DataFrame({
+            "amount_vnd": parse_vn_number(parts["amount"]) * multiplier,
+            "per_m2": parts["per_m2"].notna().to_numpy(),
+        })
+
+    parsed = _on_uniques(price, parse)
+    parsed["per_m2"] = parsed["per_m2"].fillna(False).astype(bool)
+    return parsed
+
+
+def normalize_listings(df):
+    """Add numeric columns the app can filter on.
+
+    area_m2, price_vnd_month (total monthly rent), price_per_m2 (VND per m²
+    per month), price_negotiable, and district (first part of location).
+    """
+    df = df.copy()
+    df["area_m2"] = parse_area(df["area"]) if "area" in df.columns else np.nan
+    price = parse_price(df["price"]) if "price" in df.columns else pd.DataFrame(
+        {"amount_vnd": np.nan, "per_m2": False}, index=df.index)
+    area = df["area_m2"].where(df["area_m2"] > 0)
+    df["price_vnd_month"] = price["amount_vnd"].where(~price["per_m2"], price["amount_vnd"] * area)
+    df["price_per_m2"] = price["amount_vnd"].where(price["per_m2"], price["amount_vnd"] / area)
+    df["price_negotiable"] = price["amount_vnd"].isna()
+    if "location" in df.columns:
+        df["district"] = df["location"].astype("string").str.split(",", n=1).str[0].str.strip()
+    return df
+
+
+def load_listings(paths):
+    frames = []
+    for path in paths:
+        df = read_listings(path)
+        df["source"] = path
+        frames.append(df)
+    return normalize_listings(pd.concat(frames, ignore_index=True))
+
+
+def geocode_listings(paths=LISTING_FILES, output_file=GEOCODED_LISTINGS_FILE, geocode=None, workers=4):
+    """Geocode listings by their location text and write Latitude/Longitude to output_file.
+
+    Locations are district/ward level ("Đống Đa, Hà Nội"), so address
+    dedup collapses the batch to a few dozen distinct lookups; re-runs only
+    look up rows missing from the previous output.
+    """
+    from batch_geocode import geocode_dataframe
+    from geocoding import nominatim_geocoder, provider_limiter
+
+    if geocode is None:
+        geocode = nominatim_geocoder("platewise_listings_1.0", limiter=provider_limiter("nominatim"))
+    df = load_listings(paths)
+    df, stats = geocode_dataframe(df, geocode, output_file, address_col="location", workers=workers)
+    print(f"Geocoded {stats.found}/{stats.rows} listings in {stats.elapsed:.1f}s -> {output_file}")
+    return df
+
+
+def benchmark(paths, n=500_000):
+    raw = pd.concat([read_listings(p) for p in paths], ignore_index=True)
+    raw["area"] = raw["area"].astype(str)
+    big = raw.sample(n, replace=True, random_state=0).reset_index(drop=True)
+    start = time.perf_counter()
+    normalize_listings(big)
+    print(f"normalized {n:,} listings in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--geocode":
+        geocode_listings(sys.argv[2:] or LISTING_FILES)
+        sys.exit()
+    paths = sys.argv[1:] or LISTING_FILES
+    df = load_listings(paths)
+    print(df[["price", "area", "price_vnd_month", "area_m2", "price_per_m2", "district"]].head(10).to_string())
+    print(df[["price_vnd_month", "area_m2", "price_per_m2"]].describe().to_string())
+    benchmark(paths)
@@ -0,0 +1,244 @@
+import json
+import time
+
+import folium
+import numpy as np
+import pandas as pd
+from folium.map import Layer
+from branca.colormap import LinearColormap
+from folium.plugins import FastMarkerCluster, HeatMap
+from folium.template import Template
+
+CLUSTER_THRESHOLD = 150
+
+MARKER_MODES = ("auto", "markers", "cluster")
+
+DETAIL_COLUMNS = ["name", "address", "category", "rating", "price_range", "opening_hours"]
+DETAIL_LABELS = [None, "Địa chỉ: ", "Loại hình: ", "Rating: ", "Giá: ", "Giờ mở cửa: "]
+RESTAURANT_ICON = {"icon": "cutlery", "prefix": "fa", "markerColor": "green"}
+
+LISTING_DETAIL_COLUMNS = ["title", "price", "area", "location", "published"]
+LISTING_DETAIL_LABELS = [None, "Giá thuê: ", "Diện tích: ", "Khu vực: ", "Đăng: "]
+LISTING_ICON = {"icon": "home", "prefix": "fa", "markerColor": "blue"}
+
+# Popups only carry a row id; the HTML is built in the browser from the
+# shared `details` array the first time a popup opens. The first column is
+# the bold title; the others are shown with their label when not null.
+_CALLBACK_TEMPLATE = """(function () {
+    var details = %(details)s;
+    var labels = %(labels)s;
+    var iconOptions = %(icon)s;
+    function esc(value) {
+        return String(value).replace(/[&<>"]/g, function (c) {
+            return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"}[c];
+        });
+    }
+    function popupHtml(d) {
+        var html = "<b>" + esc(d[0] === null ? "N/A" : d[0]) + "</b>";
+        for (var j = 1; j < d.length; j++) {
+            if (d[j] !== null) {
+                html += "<br>" + labels[j] + esc(d[j]);
+            }
+        }
+        return html;
+    }
+    return function (row) {
+        var icon = L.AwesomeMarkers.icon(iconOptions);
+        var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+        marker.bindPopup(function () { return popupHtml(details[row[2]]); }, {maxWidth: 300});
+        return marker;
+    };
+})()"""
+
+
+def _js(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+
+
+class LazyMarkers(Layer):
+    """Un-clustered markers created in the browser from [lat, lon, id] rows and a JS callback."""
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                var callback = {{ this.callback }};
+                var data = {{ this.data|tojson }};
+                var layer = L.featureGroup();
+                for (var i = 0; i < data.length; i++) {
+                    callback(data[i]).addTo(layer);
+                }
+                layer.addTo({{ this._parent.get_name() }});
+                return layer;
+            })();
+        {% endmacro %}"""
+    )
+
+    def __init__(self, data, callback, name=None, overlay=True, control=True, show=True):
+        super().__init__(name=name, overlay=overlay, control=control, show=show)
+        self._name = "LazyMarkers"
+        self.data = data
+        self.callback = callback
+
+
+def marker_payload(df, columns=DETAIL_COLUMNS, labels=DETAIL_LABELS, icon=RESTAURANT_ICON):
+    """([lat, lon, id] rows, JS callback embedding one compact details array) for df.
+
+    Built column-wise: "Unknown"/NaN become null, rating is formatted to one
+    decimal, and no per-row Python string formatting happens.
+    """
+    df = df.dropna(subset=["latitude", "longitude"])
+    details = pd.DataFrame(index=df.index)
+    for col in columns:
+        if col not in df.columns:
+            details[col] = None
+        elif col == "rating":
+            rating = pd.to_numeric(df[col], errors="coerce").astype(float)
+            details[col] = pd.Series(np.char.mod("%.1f", rating.to_numpy()), index=df.index).where(rating.notna())
+        else:
+            details[col] = df[col].astype(object).mask(df[col].astype(str) == "Unknown")
+    details = details.astype(object).where(details.notna(), None)
+    lats = df["latitude"].astype(float).round(6).tolist()
+    lons = df["longitude"].astype(float).round(6).tolist()
+    data = [list(row) for row in zip(lats, lons, range(len(df)))]
+    return data, _CALLBACK_TEMPLATE % {"details": _js(details.values.tolist()), "labels": _js(labels), "icon": _js(icon)}
+
+
+def add_marker_layer(m, df, name, **payload_kwargs):
+    """Plain (un-clustered) markers with lazily rendered popups."""
+    data, callback = marker_payload(df, **payload_kwargs)
+    return LazyMarkers(data, callback, name=name).add_to(m)
+
+
+def add_cluster_layer(m, df, name, **payload_kwargs):
+    """Clustered markers with lazily rendered popups."""
+    data, callback = marker_payload(df, **payload_kwargs)
+    return FastMarkerCluster(data, callback=callback, name=name).add_to(m)
+
+
+def resolve_mode(mode, n_rows, cluster_threshold=CLUSTER_THRESHOLD):
+    if mode == "auto":
+        return "cluster" if n_rows > cluster_threshold else "markers"
+    return mode
+
+
+def add_restaurant_layer(m, df, name="Nhà hàng lân cận (đã lọc)", mode="auto", cluster_threshold=CLUSTER_THRESHOLD):
+    """Add df as a marker layer; "auto" switches to clustering past cluster_threshold rows.
+
+    Returns the mode actually used.
+    """
+    mode = resolve_mode(mode, len(df), cluster_threshold)
+    if mode == "cluster":
+        add_cluster_layer(m, df, name)
+    else:
+        add_marker_layer(m, df, name)
+    return mode
+
+
+def listing_layer(df, name="Mặt bằng cho thuê", mode="auto", cluster_threshold=CLUSTER_THRESHOLD):
+    """Commercial listings as a standalone FeatureGroup.
+
+    Meant for st_folium(feature_group_to_add=...), which swaps the group in
+    the browser without re-rendering the base map.
+    """
+    fg = folium.FeatureGroup(name=name)
+    payload = dict(columns=LISTING_DETAIL_COLUMNS, labels=LISTING_DETAIL_LABELS, icon=LISTING_ICON)
+    if resolve_mode(mode, len(df), cluster_threshold) == "cluster":
+        add_cluster_layer(fg, df, name, **payload)
+    else:
+        add_marker_layer(fg, df, name, **payload)
+    return fg
+
+
+DENSITY_METRICS = {"count": "Số nhà hàng", "mean_rating": "Rating trung bình", "reviews": "Tổng review"}
+
+
+def add_heatmap_layer(m, cells, name="Mật độ nhà hàng", metric="count"):
+    """Heatmap of per-cell aggregates: one weighted point per non-empty cell."""
+    weights = cells[metric].fillna(0).astype(float)
+    top = weights.max() if len(weights) else 0
+    data = [[lat, lon, w / top] for lat, lon, w in zip(cells["latitude"].round(6), cells["longitude"].round(6), weights)
+            if w > 0] if top > 0 else []
+    return HeatMap(data, name=name, radius=20, blur=15, min_opacity=0.3).add_to(m)
+
+
+def add_choropleth_layer(m, grid, cells, name="Mức độ cạnh tranh", metric="count"):
+    """Grid cells shaded by `metric`, with the cell aggregates in the tooltip.
+
+    Returns None (and adds nothing) when no cell has a value for `metric`,
+    e.g. mean_rating for categories without any rated restaurant.
+    """
+    values = cells[metric].astype(float)
+    if not values.notna().any():
+        return None
+    south, west, north, east = grid.cell_bounds(cells["cell"].to_numpy())
+    colormap = LinearColormap(["#ffffb2", "#fd8d3c", "#bd0026"], vmin=float(values.min()), vmax=float(values.max()),
+                              caption=DENSITY_METRICS[metric])
+    mean_rating = cells["mean_rating"].astype(object).where(cells["mean_rating"].notna(), None)
+    features = []
+    for s, w, n, e, count, rating, reviews, value in zip(
+            south.round(6), west.round(6), north.round(6), east.round(6),
+            cells["count"].tolist(), mean_rating.tolist(), cells["reviews"].tolist(), values.tolist()):
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [[[w, s], [e, s], [e, n], [w, n], [w, s]]]},
+            "properties": {
+                "count": count,
+                "mean_rating": rating,
+                "reviews": reviews,
+                "color": colormap(value) if pd.notna(value) else "#cccccc",
+            },
+        })
+    layer = folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        name=name,
+        style_function=lambda feature: {"fillColor": feature["properties"]["color"], "color": "#666666",
+                                        "weight": 0.3, "fillOpacity": 0.55},
+        tooltip=folium.GeoJsonTooltip(fields=list(DENSITY_METRICS), aliases=list(DENSITY_METRICS.values())),
+    ).add_to(m)
+    colormap.add_to(m)
+    return layer
+
+
+def payload_size(m):
+    """Size in bytes of the HTML/JS folium generates for a map."""
+    return len(m.get_root().render().encode("utf-8"))
+
+
+def _eager_marker_layer(m, df, name):
+    # The pre-rendered folium.Marker + folium.Popup layer this module replaced; kept as a baseline.
+    fg = folium.FeatureGroup(name=name)
+    for index, row in df.iterrows():
+        html = f"<b>{row.get('name', 'N/A')}</b><br>Địa chỉ: {row.get('address', 'N/A')}"
+        for col, label in (("category", "Loại hình"), ("price_range", "Giá"), ("opening_hours", "Giờ mở cửa")):
+            if pd.notna(row.get(col)) and row.get(col) != "Unknown":
+                html += f"<br>{label}: {row.get(col)}"
+        if pd.notna(row.get("rating")):
+            html += f"<br>Rating: {row.get('rating'):.1f}"
+        folium.Marker(
+            location=[row["latitude"], row["longitude"]],
+            popup=folium.Popup(html, max_width=300),
+            icon=folium.Icon(color="green", icon="cutlery", prefix="fa")
+        ).add_to(fg)
+    fg.add_to(m)
+
+
+def compare_payloads(df, sizes=(50, 200, 1000)):
+    for n in sizes:
+        sample = df.head(n)
+        line = f"n={len(sample):>5}"
+        for mode in ("eager", "markers", "cluster"):
+            m = folium.Map(location=[21.0285, 105.8542], zoom_start=13)
+            start = time.perf_counter()
+            if mode == "eager":
+                _eager_marker_layer(m, sample, "eager")
+            else:
+                add_restaurant_layer(m, sample, mode=mode)
+            size = payload_size(m)
+            elapsed = time.perf_counter() - start
+            line += f"  {mode}: {size / 1024:9.1f} KiB {elapsed * 1000:8.1f} ms"
+        print(line)
+
+
+if __name__ == "__main__":
+    compare_payloads(pd.read_csv("restaurantsHanoi_augmented.csv"))
@@ -0,0 +1,110 @@
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# (label, start minute, end minute); "Đêm" runs past midnight so its end is > 24h.
+PERIODS = [
+    ("Sáng (6:00-11:00)", 6 * 60, 11 * 60),
+    ("Trưa (11:00-14:00)", 11 * 60, 14 * 60),
+    ("Chiều (14:00-17:00)", 14 * 60, 17 * 60),
+    ("Tối (17:00-22:00)", 17 * 60, 22 * 60),
+    ("Đêm (22:00-6:00)", 22 * 60, 30 * 60),
+]
+PERIOD_LABELS = [label for label, _, _ in PERIODS]
+PERIOD_BITS = {label: 1 << i for i, label in enumerate(PERIOD_LABELS)}
+ALL_DAY = (1 << len(PERIODS)) - 1
+
+_KEYWORDS = [
+    (("sáng", "morning"), PERIOD_BITS["Sáng (6:00-11:00)"]),
+    (("trưa", "noon"), PERIOD_BITS["Trưa (11:00-14:00)"]),
+    (("chiều", "afternoon"), PERIOD_BITS["Chiều (14:00-17:00)"]),
+    (("tối", "evening"), PERIOD_BITS["Tối (17:00-22:00)"]),
+    (("đêm", "night"), PERIOD_BITS["Đêm (22:00-6:00)"]),
+    (("cả ngày", "24/7", "24h", "all day"), ALL_DAY),
+]
+
+_INTERVAL = re.compile(r"(\d{1,2})\s*[:h]\s*(\d{2})?\s*[-–—]\s*(\d{1,2})\s*[:h]\s*(\d{2})?")
+
+
+def interval_mask(start, end):
+    """Period bits overlapped by [start, end) in minutes after midnight; wraps past midnight."""
+    if end <= start:
+        end += 24 * 60
+    mask = 0
+    for i, (_, p_start, p_end) in enumerate(PERIODS):
+        for shift in (0, 24 * 60):
+            if start + shift < p_end and p_start < end + shift:
+                mask |= 1 << i
+    return mask
+
+
+def parse_opening_hours(text):
+    """Bitmask of PERIODS during which `text` says the place is open; 0 if unknown."""
+    if not isinstance(text, str):
+        return 0
+    text = unicodedata.normalize("NFC", text).casefold()
+    mask = 0
+    for h1, m1, h2, m2 in _INTERVAL.findall(text):
+        mask |= interval_mask(int(h1) * 60 + int(m1 or 0), int(h2) * 60 + int(m2 or 0))
+    for words, bits in _KEYWORDS:
+        if any(word in text for word in words):
+            mask |= bits
+    return mask
+
+
+def opening_hours_mask(values):
+    """Vectorized parse of an opening-hours column into a uint8 period mask.
+
+    Each distinct string is parsed once, so the cost scales with the number
+    of unique values rather than rows.
+    """
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    parsed = np.fromiter((parse_opening_hours(u) for u in uniques), dtype=np.uint8, count=len(uniques))
+    parsed = np.append(parsed, np.uint8(0))  # code -1 (NaN) maps to the trailing 0
+    return parsed[codes]
+
+
+def periods_mask(labels):
+    mask = 0
+    for label in labels:
+        mask |= PERIOD_BITS[label]
+    return mask
+
+
+def matches_periods(hours_mask, labels):
+    """Boolean array: open during at least one of the selected period labels."""
+    return (np.asarray(hours_mask) & periods_mask(labels)) != 0
+
+
+def _self_check(path="restaurantsHanoi_augmented.csv"):
+    bits = PERIOD_BITS
+    expected = {
+        "Chỉ buổi tối": bits["Tối (17:00-22:00)"],
+        "Chỉ buổi sáng": bits["Sáng (6:00-11:00)"],
+        "Cả ngày": ALL_DAY,
+        "Cuối tuần": 0,
+        "Unknown": 0,
+        "08:00 - 22:00": ALL_DAY & ~bits["Đêm (22:00-6:00)"],
+        "10:00 - 23:00": ALL_DAY,
+        "07:00 - 19:00": ALL_DAY & ~bits["Đêm (22:00-6:00)"],
+        "11:00 - 14:00, 17:00 - 22:00": bits["Trưa (11:00-14:00)"] | bits["Tối (17:00-22:00)"],
+        "22:00 - 02:00": bits["Đêm (22:00-6:00)"],
+        "0:00 - 1:00": bits["Đêm (22:00-6:00)"],
+    }
+    for text, mask in expected.items():
+        assert parse_opening_hours(text) == mask, (text, parse_opening_hours(text), mask)
+    # "10:00" must not count as night because it contains "0:".
+    assert not matches_periods(opening_hours_mask(["10:00 - 11:00"]), ["Đêm (22:00-6:00)"])[0]
+
+    df = pd.read_csv(path)
+    mask = opening_hours_mask(df["opening_hours"])
+    for label in PERIOD_LABELS:
+        print(f"{label:<22} {matches_periods(mask, [label]).sum():>5} / {len(df)}")
+    unparsed = df.loc[mask == 0, "opening_hours"].value_counts()
+    print("unparsed:", {text: int(count) for text, count in unparsed.items()})
+
+
+if __name__ == "__main__":
+    _self_check()
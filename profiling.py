@@ -0,0 +1,95 @@
+import cProfile
+import io
+import json
+import logging
+import pstats
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+logger = logging.getLogger("platewise.perf")
+
+
+class Stage:
+    """Timing record for one stage; `rows` can be filled in inside the with-block."""
+
+    __slots__ = ("name", "seconds", "rows")
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.seconds = 0.0
+        self.rows = rows
+
+
+class RunProfiler:
+    """Per-stage wall times and row counts for one Streamlit run (or fragment run).
+
+        perf = RunProfiler("app")
+        with perf.stage("filters") as stage:
+            df = df[mask]
+            stage.rows = len(df)
+        perf.emit()
+    """
+
+    def __init__(self, scope="app"):
+        self.scope = scope
+        self.stages = []
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        record = Stage(name, rows)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - start
+            self.stages.append(record)
+
+    def extend(self, other):
+        self.stages.extend(other.stages)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def records(self):
+        return [{"stage": s.name, "ms": round(s.seconds * 1000, 2), "rows": s.rows} for s in self.stages]
+
+    def to_frame(self):
+        return pd.DataFrame(self.records(), columns=["stage", "ms", "rows"])
+
+    def emit(self, **fields):
+        """Log the run as one JSON line on the "platewise.perf" logger."""
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"scope": self.scope, "total_ms": round(self.elapsed * 1000, 2),
+                                    "stages": self.records(), **fields}, ensure_ascii=False, default=str))
+
+
+def configure_logging(target):
+    """Send perf records to a file, or to stderr when target is "-"; idempotent."""
+    if any(getattr(h, "_platewise_target", None) == target for h in logger.handlers):
+        return
+    handler = logging.StreamHandler() if target == "-" else logging.FileHandler(target, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    handler._platewise_target = target
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def start_profile():
+    profile = cProfile.Profile()
+    profile.enable()
+    return profile
+
+
+def stop_profile(profile, path=None, limit=30):
+    """Stop a cProfile session; returns the top `limit` functions by cumulative time as text."""
+    profile.disable()
+    if path:
+        profile.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
@@ -0,0 +1,194 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from gazetteer import district_of
+from opening_hours import PERIOD_LABELS
+from site_grid import CellGrid, aggregate_restaurants, cell_totals
+
+# Quiz q1 answer -> restaurant categories it competes with.
+CUISINE_CATEGORIES = {
+    "Ẩm thực Việt": ["Nhà hàng Việt", "Phở", "Bún Chả", "Cơm văn phòng", "Đặc sản vùng miền"],
+    "Ẩm thực Á (Nhật, Hàn, Trung, Thái...)": ["Nhà hàng Á", "Lẩu"],
+    "Ẩm thực Âu (Ý, Pháp, Tây Ban Nha...)": ["Nhà hàng Âu"],
+    "Đồ ăn nhanh/Quốc tế": ["Đồ ăn nhanh", "Bánh mì"],
+    "Quán cà phê/Trà sữa": ["Cà phê", "Trà sữa"],
+    "Quán ăn vặt/Đồ ngọt": ["Trà sữa", "Bánh mì", "Đồ ăn nhanh"],
+    "Nhà hàng chay": ["Đồ chay"],
+    "Khác": ["Quán nhậu", "Hải sản", "Lẩu"],
+}
+
+# Quiz q3 answer -> price_range label in the restaurant data.
+PRICE_TIERS = {
+    "Bình dân (< 100.000đ)": "Bình dân (<100k)",
+    "Trung bình (100.000đ - 300.000đ)": "Trung bình (100k-300k)",
+    "Cao cấp (> 300.000đ)": "Cao cấp (>300k)",
+}
+
+STRATEGY_AVOID, STRATEGY_JOIN, STRATEGY_NEUTRAL = (
+    "Tránh khu vực có nhiều nhà hàng cùng loại",
+    "Chọn khu vực tập trung nhiều nhà hàng để thu hút khách sẵn có",
+    "Không quan trọng, tập trung vào chất lượng sản phẩm",
+)
+COMPETITION_WEIGHTS = {STRATEGY_AVOID: -0.3, STRATEGY_JOIN: 0.2, STRATEGY_NEUTRAL: 0.0}
+
+# Listings are bucketed by area (q8) and monthly rent (q9); the last bucket
+# of each axis holds unknown values ("Giá thỏa thuận") and always matches.
+AREA_EDGES = [50.0, 150.0]
+AREA_TIERS = ["Nhỏ (< 50m²)", "Trung bình (50-150m²)", "Lớn (> 150m²)"]
+RENT_EDGES = [30e6, 80e6]
+BUDGET_TIERS = ["Thấp (< 500 triệu)", "Trung bình (500 triệu - 2 tỷ)", "Cao (> 2 tỷ)"]
+
+WEIGHTS = {"demand": 0.25, "activity": 0.15, "price_fit": 0.15, "quality_gap": 0.1, "rentals": 0.2}
+
+# Neighbourhood each cell is scored on: (2 * NEIGHBORHOOD + 1)^2 cells.
+NEIGHBORHOOD = 1
+
+SiteFeatures = namedtuple(
+    "SiteFeatures",
+    ["grid", "cells", "latitude", "longitude", "district", "restaurants", "listings"],
+)
+SiteFeatures.__doc__ = """Neighbourhood-summed cell features, restricted to cells with any activity.
+
+`restaurants` is a site_grid.RestaurantCells whose arrays are indexed like
+`cells`; `listings` is (n_cells, area buckets, rent buckets).
+"""
+
+
+def _bucket(values, edges):
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(np.isnan(values), len(edges) + 1, np.searchsorted(edges, values, side="right"))
+
+
+def cell_districts(grid, cells, latitudes, longitudes, districts):
+    """District of each cell: the one whose point centroid is nearest to the cell center."""
+    points = pd.DataFrame({"lat": np.asarray(latitudes, dtype=np.float64),
+                           "lon": np.asarray(longitudes, dtype=np.float64),
+                           "district": pd.Series(districts, dtype="string").to_numpy()}).dropna()
+    centroids = points.groupby("district")[["lat", "lon"]].mean()
+    if centroids.empty:
+        return np.full(len(cells), "", dtype=object)
+    lat, lon = grid.centers(cells)
+    dlat = lat[:, None] - centroids["lat"].to_numpy()[None, :]
+    dlon = (lon[:, None] - centroids["lon"].to_numpy()[None, :]) * np.cos(np.radians(lat))[:, None]
+    return centroids.index.to_numpy()[np.argmin(dlat ** 2 + dlon ** 2, axis=1)]
+
+
+def build_site_features(restaurants, listings=None, grid=None, neighborhood=NEIGHBORHOOD):
+    """Precompute per-cell features once; recommend_sites() then only does array arithmetic."""
+    grid = grid or CellGrid()
+    agg = aggregate_restaurants(restaurants, grid)
+    listing_counts = np.zeros((grid.size, len(AREA_EDGES) + 2, len(RENT_EDGES) + 2))
+    if listings is not None and len(listings):
+        listing_cells = grid.cell_of(listings["latitude"], listings["longitude"])
+        n_rent = len(RENT_EDGES) + 2
+        bucket = _bucket(listings["area_m2"], AREA_EDGES) * n_rent + _bucket(listings["price_vnd_month"], RENT_EDGES)
+        listing_counts = cell_totals(grid, listing_cells, bucket, listing_counts[0].size).reshape(listing_counts.shape)
+
+    smooth = {name: grid.neighborhood_sum(getattr(agg, name), neighborhood)
+              for name in ("count", "rating_sum", "rated", "reviews", "price_count", "period_count")}
+    listing_counts = grid.neighborhood_sum(listing_counts, neighborhood)
+
+    cells = np.flatnonzero((smooth["count"].sum(axis=1) > 0) | (listing_counts.sum(axis=(1, 2)) > 0))
+    restaurants_cells = agg._replace(**{name: array[cells] for name, array in smooth.items()})
+
+    points = pd.DataFrame({"latitude": restaurants["latitude"], "longitude": restaurants["longitude"],
+                           "district": district_of(restaurants["address"])})
+    if listings is not None and "district" in listings.columns:
+        points = pd.concat([points, listings[["latitude", "longitude", "district"]]], ignore_index=True)
+    district = cell_districts(grid, cells, points["latitude"], points["longitude"], points["district"])
+
+    lat, lon = grid.centers(cells)
+    return SiteFeatures(grid=grid, cells=cells, latitude=lat, longitude=lon, district=district,
+                        restaurants=restaurants_cells, listings=listing_counts[cells])
+
+
+def _normalized(values):
+    top = values.max(initial=0.0)
+    return values / top if top > 0 else np.zeros_like(values)
+
+
+def _columns(labels, wanted):
+    return [i for i, label in enumerate(labels) if label in set(wanted)]
+
+
+def recommend_sites(features, cuisine, price_tier=None, districts=(), strategy=STRATEGY_NEUTRAL,
+                    periods=(), area_tier=None, budget_tier=None, top_n=10):
+    """Top-N cells for one set of quiz answers, best first.
+
+    Every component is a vector over the precomputed cells, scaled to
+    [0, 1]; the score is their weighted sum. `districts` ("Quận Cầu Giấy"
+    or "Cầu Giấy") restricts the candidates when any cell matches.
+    """
+    r = features.restaurants
+    same = _columns(r.categories, CUISINE_CATEGORIES.get(cuisine, []))
+    competitors = r.count[:, same].sum(axis=1)
+    rated = r.rated[:, same].sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        competitor_rating = np.where(rated > 0, r.rating_sum[:, same].sum(axis=1) / rated, np.nan)
+    total = r.count.sum(axis=1)
+
+    demand = _normalized(np.log1p(r.reviews.sum(axis=1)))
+    open_labels = periods or PERIOD_LABELS
+    activity = _normalized(np.log1p(r.period_count[:, _columns(PERIOD_LABELS, open_labels)].sum(axis=1)))
+    tier = [PRICE_TIERS.get(price_tier, price_tier)] if price_tier else []
+    with np.errstate(invalid="ignore", divide="ignore"):
+        price_fit = np.where(total > 0, r.price_count[:, _columns(r.price_levels, tier)].sum(axis=1) / total, 0.0)
+    quality_gap = np.nan_to_num(np.clip(4.6 - competitor_rating, 0.0, 1.0))
+
+    area_buckets = [AREA_TIERS.index(area_tier)] if area_tier in AREA_TIERS else list(range(len(AREA_TIERS)))
+    max_rent = BUDGET_TIERS.index(budget_tier) if budget_tier in BUDGET_TIERS else len(BUDGET_TIERS) - 1
+    matching = features.listings[:, area_buckets + [len(AREA_TIERS)]][:, :, list(range(max_rent + 1)) + [len(BUDGET_TIERS)]]
+    rentals_available = matching.sum(axis=(1, 2))
+    rentals = _normalized(np.log1p(rentals_available))
+
+    components = {
+        "demand": demand, "activity": activity, "price_fit": price_fit,
+        "quality_gap": quality_gap, "rentals": rentals,
+        "competition": _normalized(np.log1p(competitors)),
+    }
+    weights = dict(WEIGHTS, competition=COMPETITION_WEIGHTS.get(strategy, 0.0))
+    score = sum(weights[name] * value for name, value in components.items())
+
+    candidates = np.arange(len(features.cells))
+    wanted = {d.replace("Quận ", "").replace("Huyện ", "").strip() for d in districts}
+    if wanted:
+        in_district = np.flatnonzero(np.isin(features.district, list(wanted)))
+        if len(in_district):
+            candidates = in_district
+    top = candidates[np.argsort(-score[candidates], kind="stable")[:top_n]]
+
+    return pd.DataFrame({
+        "latitude": features.latitude[top],
+        "longitude": features.longitude[top],
+        "district": features.district[top],
+        "score": np.round(score[top], 3),
+        "competitors": competitors[top].astype(int),
+        "competitor_rating": np.round(competitor_rating[top], 2),
+        "restaurants": total[top].astype(int),
+        "reviews": r.reviews[top].sum(axis=1).astype(int),
+        "listings": rentals_available[top].astype(int),
+        "cell": features.cells[top],
+    })
+
+
+def benchmark(path="restaurantsHanoi_augmented.csv", repeat=200):
+    from datastore import read_restaurants
+
+    df = read_restaurants(path)
+    start = time.perf_counter()
+    features = build_site_features(df)
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(repeat):
+        top = recommend_sites(features, "Ẩm thực Việt", "Trung bình (100.000đ - 300.000đ)",
+                              ["Quận Cầu Giấy", "Quận Đống Đa"], STRATEGY_AVOID)
+    score = (time.perf_counter() - start) / repeat
+    print(f"{len(features.cells)} candidate cells: build={build * 1000:.1f} ms  score={score * 1000:.2f} ms")
+    print(top.to_string())
+
+
+if __name__ == "__main__":
+    benchmark()
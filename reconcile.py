@@ -0,0 +1,131 @@
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from gazetteer import district_of
+from site_grid import HANOI_BOUNDS
+from spatial import haversine_np
+
+# (label, file) pairs, most trusted first: when both providers place a row
+# inside Hanoi and agree, the first one's coordinates are kept.
+PROVIDERS = [("google", "restaurantsHANOI_google_geocoded.csv"), ("nominatim", "restaurantsOCEANPARK.csv")]
+RECONCILED_FILE = "restaurantsHANOI_reconciled.csv"
+ID_COLUMN = "RestaurantID"
+DEFAULT_THRESHOLD_M = 250.0
+
+
+def in_bounds(latitudes, longitudes, bounds=HANOI_BOUNDS):
+    """True for points inside (south, west, north, east); False for missing coordinates."""
+    south, west, north, east = bounds
+    lat = np.asarray(latitudes, dtype=np.float64)
+    lon = np.asarray(longitudes, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        return (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+
+
+def reconcile(first, second, labels=("first", "second"), threshold_m=DEFAULT_THRESHOLD_M, bounds=HANOI_BOUNDS):
+    """Merge two geocodes of the same rows (joined on RestaurantID) into one best coordinate.
+
+    `first` and `second` are DataFrames with RestaurantID, Latitude and
+    Longitude; `first` carries the other columns of the output and is
+    preferred when the two agree. Adds the per-provider coordinates,
+    distance_m between them, out_of_bounds_<label> flags and a status:
+
+    - agree: both inside `bounds` and within `threshold_m`
+    - disagree: both inside but farther apart; the one nearer the median of
+      agreeing rows in the same district wins, `first` when there is none
+    - only_<label>: the other is missing or outside `bounds`
+    - none: neither is usable; Latitude/Longitude are NaN
+    """
+    a, b = labels
+    lat_a, lon_a, lat_b, lon_b = f"Latitude_{a}", f"Longitude_{a}", f"Latitude_{b}", f"Longitude_{b}"
+    left = first.rename(columns={"Latitude": lat_a, "Longitude": lon_a})
+    right = second[[ID_COLUMN, "Latitude", "Longitude"]].rename(columns={"Latitude": lat_b, "Longitude": lon_b})
+    df = left.merge(right.drop_duplicates(ID_COLUMN), on=ID_COLUMN, how="left", validate="many_to_one")
+
+    coords = {c: df[c].to_numpy(dtype=np.float64) for c in (lat_a, lon_a, lat_b, lon_b)}
+    ok_a = in_bounds(coords[lat_a], coords[lon_a], bounds)
+    ok_b = in_bounds(coords[lat_b], coords[lon_b], bounds)
+    distance = haversine_np(coords[lon_a], coords[lat_a], coords[lon_b], coords[lat_b])
+    both = ok_a & ok_b
+    with np.errstate(invalid="ignore"):
+        agree = both & (distance <= threshold_m)
+    disagree = both & ~agree
+
+    use_b = ok_b & ~ok_a
+    if disagree.any() and "Address" in df.columns:
+        district = district_of(df["Address"])
+        anchors = pd.DataFrame({"district": district[agree], "lat": coords[lat_a][agree], "lon": coords[lon_a][agree]})
+        medians = anchors.groupby("district")[["lat", "lon"]].median()
+        anchor = medians.reindex(district[disagree]).to_numpy()
+        rows = np.flatnonzero(disagree)
+        d_a = haversine_np(coords[lon_a][rows], coords[lat_a][rows], anchor[:, 1], anchor[:, 0])
+        d_b = haversine_np(coords[lon_b][rows], coords[lat_b][rows], anchor[:, 1], anchor[:, 0])
+        use_b[rows] = ~np.isnan(anchor[:, 0]) & (d_b < d_a)
+
+    usable = ok_a | ok_b
+    df.insert(df.columns.get_loc(lat_a), "Latitude", np.where(use_b, coords[lat_b], np.where(usable, coords[lat_a], np.nan)))
+    df.insert(df.columns.get_loc(lat_a), "Longitude", np.where(use_b, coords[lon_b], np.where(usable, coords[lon_a], np.nan)))
+    df["distance_m"] = np.round(distance, 1)
+    df[f"out_of_bounds_{a}"] = ~np.isnan(coords[lat_a]) & ~ok_a
+    df[f"out_of_bounds_{b}"] = ~np.isnan(coords[lat_b]) & ~ok_b
+    statuses = ["agree", "disagree", f"only_{a}", f"only_{b}", "none"]
+    df["source"] = np.where(usable, np.where(use_b, b, a), "")
+    df["status"] = pd.Categorical(np.select([agree, disagree, ok_a, ok_b], statuses[:4], default="none"),
+                                  categories=statuses)
+    return df
+
+
+def reconcile_files(providers=PROVIDERS, output_file=RECONCILED_FILE, threshold_m=DEFAULT_THRESHOLD_M):
+    """Reconcile two geocoded CSVs and write the merged dataset; returns it."""
+    (a, path_a), (b, path_b) = providers
+    first = pd.read_csv(path_a, encoding="utf-8-sig")
+    second = pd.read_csv(path_b, encoding="utf-8-sig")
+    for df in (first, second):
+        df[["Latitude", "Longitude"]] = df[["Latitude", "Longitude"]].apply(pd.to_numeric, errors="coerce")
+    start = time.perf_counter()
+    merged = reconcile(first, second, labels=(a, b), threshold_m=threshold_m)
+    elapsed = time.perf_counter() - start
+    merged.to_csv(output_file, index=False, encoding="utf-8-sig")
+    summary(merged, (a, b))
+    print(f"Reconciled {len(merged)} rows in {elapsed * 1000:.1f} ms; saved to {output_file}")
+    return merged
+
+
+def summary(merged, labels):
+    print(merged["status"].value_counts(sort=False).to_string())
+    for label in labels:
+        print(f"out of bounds ({label}): {int(merged[f'out_of_bounds_{label}'].sum())}")
+    distance = merged["distance_m"].dropna()
+    if len(distance):
+        print(f"distance between providers: median {distance.median():.0f} m, "
+              f"p90 {distance.quantile(0.9):.0f} m, max {distance.max():.0f} m")
+
+
+def benchmark(n=100_000, seed=0):
+    from spatial import synthetic_points
+
+    rng = np.random.default_rng(seed)
+    points = synthetic_points(n, seed)
+    first = pd.DataFrame({ID_COLUMN: np.arange(n), "Address": rng.choice(["a, X, Hà Nội", "b, Y, Hà Nội"], n),
+                          "Latitude": points["latitude"], "Longitude": points["longitude"]})
+    second = first[[ID_COLUMN]].copy()
+    jitter = rng.normal(0, 0.0005, (n, 2))
+    jitter[rng.random(n) < 0.05] *= 50
+    second["Latitude"] = first["Latitude"] + jitter[:, 0]
+    second["Longitude"] = first["Longitude"] + jitter[:, 1]
+    second.loc[rng.random(n) < 0.02, ["Latitude", "Longitude"]] = np.nan
+    second = second.sample(frac=1, random_state=seed)
+    start = time.perf_counter()
+    merged = reconcile(first, second)
+    print(f"n={n:,}  reconcile={(time.perf_counter() - start) * 1000:.0f} ms")
+    print(merged["status"].value_counts().to_string())
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--benchmark"]:
+        benchmark(*map(int, sys.argv[2:3]))
+    else:
+        reconcile_files(threshold_m=float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_THRESHOLD_M)
@@ -0,0 +1,145 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from opening_hours import PERIODS
+from spatial import METERS_PER_DEGREE_LAT
+
+# (south, west, north, east) covering the urban districts plus Gia Lâm / Hoài Đức.
+HANOI_BOUNDS = (20.90, 105.65, 21.15, 106.05)
+DEFAULT_CELL_SIZE_M = 500
+
+RestaurantCells = namedtuple(
+    "RestaurantCells",
+    ["categories", "count", "rating_sum", "rated", "reviews", "price_levels", "price_count", "period_count"],
+)
+RestaurantCells.__doc__ = """Per-cell restaurant aggregates; arrays are (grid.size, n_groups).
+
+count/rating_sum/rated/reviews are split by category, price_count by
+price level and period_count by opening-hours period.
+"""
+
+
+class CellGrid:
+    """Fixed lat/lon grid over a bounding box; cells are numbered row * ncols + col."""
+
+    def __init__(self, bounds=HANOI_BOUNDS, cell_size_m=DEFAULT_CELL_SIZE_M):
+        south, west, north, east = bounds
+        self.bounds = bounds
+        self.cell_size_m = cell_size_m
+        self.cell_lat = cell_size_m / METERS_PER_DEGREE_LAT
+        self.cell_lon = self.cell_lat / np.cos(np.radians((south + north) / 2))
+        self.nrows = int(np.ceil((north - south) / self.cell_lat))
+        self.ncols = int(np.ceil((east - west) / self.cell_lon))
+        self.size = self.nrows * self.ncols
+
+    def cell_of(self, latitudes, longitudes):
+        """Cell number of each point; -1 for points outside the grid or without coordinates."""
+        lat = np.asarray(latitudes, dtype=np.float64)
+        lon = np.asarray(longitudes, dtype=np.float64)
+        south, west, _, _ = self.bounds
+        with np.errstate(invalid="ignore"):
+            rows = np.floor((lat - south) / self.cell_lat)
+            cols = np.floor((lon - west) / self.cell_lon)
+            inside = (rows >= 0) & (rows < self.nrows) & (cols >= 0) & (cols < self.ncols)
+        cells = np.full(len(lat), -1, dtype=np.int64)
+        cells[inside] = rows[inside].astype(np.int64) * self.ncols + cols[inside].astype(np.int64)
+        return cells
+
+    def cell_bounds(self, cells=None):
+        """(south, west, north, east) arrays for `cells` (all cells by default)."""
+        cells = np.arange(self.size) if cells is None else np.asarray(cells)
+        south = self.bounds[0] + (cells // self.ncols) * self.cell_lat
+        west = self.bounds[1] + (cells % self.ncols) * self.cell_lon
+        return south, west, south + self.cell_lat, west + self.cell_lon
+
+    def centers(self, cells=None):
+        south, west, north, east = self.cell_bounds(cells)
+        return (south + north) / 2, (west + east) / 2
+
+    def neighborhood_sum(self, values, radius=1):
+        """Sum of `values` (shape (size, ...)) over the (2r+1)x(2r+1) cells around each cell.
+
+        Uses a summed-area table, so the cost does not depend on the radius.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        grid = values.reshape((self.nrows, self.ncols) + values.shape[1:])
+        table = np.zeros((self.nrows + 1, self.ncols + 1) + values.shape[1:])
+        table[1:, 1:] = grid.cumsum(axis=0).cumsum(axis=1)
+        rows = np.arange(self.nrows)
+        cols = np.arange(self.ncols)
+        r0, r1 = np.clip(rows - radius, 0, self.nrows), np.clip(rows + radius + 1, 0, self.nrows)
+        c0, c1 = np.clip(cols - radius, 0, self.ncols), np.clip(cols + radius + 1, 0, self.ncols)
+        total = (table[r1][:, c1] - table[r0][:, c1] - table[r1][:, c0] + table[r0][:, c0])
+        return total.reshape(values.shape)
+
+
+def cell_totals(grid, cells, groups=None, n_groups=1, weights=None):
+    """(grid.size, n_groups) sums of `weights` (or counts) per cell and group.
+
+    Points with a negative cell or group are ignored.
+    """
+    cells = np.asarray(cells, dtype=np.int64)
+    groups = np.zeros(len(cells), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+    keep = (cells >= 0) & (groups >= 0)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)
+        keep &= ~np.isnan(weights)
+        weights = weights[keep]
+    flat = np.bincount(cells[keep] * n_groups + groups[keep], weights=weights, minlength=grid.size * n_groups)
+    return flat.reshape(grid.size, n_groups)
+
+
+def _codes(series):
+    categorical = series.astype("category")
+    return categorical.cat.codes.to_numpy(dtype=np.int64), categorical.cat.categories
+
+
+def aggregate_restaurants(df, grid):
+    """RestaurantCells for a cleaned restaurant table (see datastore.clean_restaurants)."""
+    cells = grid.cell_of(df["latitude"], df["longitude"])
+    codes, categories = _codes(df["category"])
+    n = len(categories)
+    rating = pd.to_numeric(df["rating"], errors="coerce").to_numpy(dtype=np.float64)
+    reviews = pd.to_numeric(df["review_count"], errors="coerce").to_numpy(dtype=np.float64)
+    price_codes, price_levels = _codes(df["price_range"])
+
+    hours = np.asarray(df["hours_mask"], dtype=np.int64)
+    period_count = np.stack(
+        [cell_totals(grid, cells, weights=(hours >> i) & 1)[:, 0] for i in range(len(PERIODS))], axis=1
+    )
+    return RestaurantCells(
+        categories=categories,
+        count=cell_totals(grid, cells, codes, n),
+        rating_sum=cell_totals(grid, cells, codes, n, weights=rating),
+        rated=cell_totals(grid, cells, codes, n, weights=np.where(np.isnan(rating), np.nan, 1.0)),
+        reviews=cell_totals(grid, cells, codes, n, weights=reviews),
+        price_levels=price_levels,
+        price_count=cell_totals(grid, cells, price_codes, len(price_levels)),
+        period_count=period_count,
+    )
+
+
+def category_cells(agg, grid, categories=()):
+    """Non-empty cells for the selected categories (all when empty) as a DataFrame.
+
+    Columns: cell, latitude/longitude (cell center), count, mean_rating,
+    reviews; this is all the density layers send to the browser.
+    """
+    columns = [i for i, c in enumerate(agg.categories) if c in set(categories)] if categories else slice(None)
+    count = agg.count[:, columns].sum(axis=1)
+    cells = np.flatnonzero(count > 0)
+    rated = agg.rated[cells][:, columns].sum(axis=1)
+    rating_sum = agg.rating_sum[cells][:, columns].sum(axis=1)
+    lat, lon = grid.centers(cells)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_rating = np.where(rated > 0, rating_sum / rated, np.nan)
+    return pd.DataFrame({
+        "cell": cells,
+        "latitude": lat,
+        "longitude": lon,
+        "count": count[cells].astype(int),
+        "mean_rating": np.round(mean_rating, 2),
+        "reviews": agg.reviews[cells][:, columns].sum(axis=1).astype(int),
+    })
@@ -0,0 +1,255 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE_LAT = np.pi * EARTH_RADIUS_M / 180
+
+QueryStats = namedtuple("QueryStats", ["total", "candidates", "pruned", "matched"])
+
+
+def haversine_np(lon1, lat1, lon2, lat2):
+    """Great-circle distance in meters, vectorized over numpy arrays (degrees in)."""
+    lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+class RadiusSearch:
+    """Radius queries over a fixed set of points using cached radian arrays."""
+
+    def __init__(self, latitudes, longitudes):
+        lat = np.asarray(latitudes, dtype=np.float64)
+        lon = np.asarray(longitudes, dtype=np.float64)
+        self.valid = ~(np.isnan(lat) | np.isnan(lon))
+        self.lat = lat
+        self.lon = lon
+        self.lat_rad = np.radians(lat)
+        self.lon_rad = np.radians(lon)
+        self.cos_lat = np.cos(self.lat_rad)
+
+    def __len__(self):
+        return len(self.lat_rad)
+
+    def distances(self, lat, lon, indices=None):
+        """Distance in meters from (lat, lon) to every point, or to `indices` only."""
+        lat_rad, lon_rad = np.radians(lat), np.radians(lon)
+        if indices is None:
+            p_lat, p_lon, p_cos = self.lat_rad, self.lon_rad, self.cos_lat
+        else:
+            p_lat, p_lon, p_cos = self.lat_rad[indices], self.lon_rad[indices], self.cos_lat[indices]
+        a = np.sin((p_lat - lat_rad) / 2) ** 2 + np.cos(lat_rad) * p_cos * np.sin((p_lon - lon_rad) / 2) ** 2
+        return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def _candidates(self, lat, lon, radius_m):
+        return np.flatnonzero(self.valid)
+
+    def query_radius(self, lat, lon, radius_m, sort=False, return_stats=False):
+        """Return (positional indices, distances in meters) of points within radius_m.
+
+        With return_stats=True a QueryStats tuple is appended to the result.
+        """
+        candidates = self._candidates(lat, lon, radius_m)
+        dist = self.distances(lat, lon, candidates)
+        mask = dist <= radius_m
+        indices, dist = candidates[mask], dist[mask]
+        if sort:
+            order = np.argsort(dist, kind="stable")
+            indices, dist = indices[order], dist[order]
+        if return_stats:
+            total = len(self)
+            return indices, dist, QueryStats(total, len(candidates), total - len(candidates), len(indices))
+        return indices, dist
+
+    def _bbox_candidates(self, south, west, north, east):
+        return np.flatnonzero(self.valid)
+
+    def query_bbox(self, south, west, north, east, limit=None):
+        """Positional indices of points inside a lat/lon box, e.g. the visible map viewport.
+
+        With `limit`, at most that many indices are returned (evenly thinned).
+        """
+        candidates = self._bbox_candidates(south, west, north, east)
+        lat, lon = self.lat[candidates], self.lon[candidates]
+        indices = candidates[(lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)]
+        if limit is not None and len(indices) > limit:
+            indices = indices[np.linspace(0, len(indices) - 1, limit).astype(np.int64)]
+        return indices
+
+    def query_knn(self, lat, lon, k, return_stats=False):
+        """Return (positional indices, distances in meters) of the k nearest points, nearest first."""
+        candidates = self._candidates(lat, lon, np.inf)
+        return self._select_knn(lat, lon, k, candidates, return_stats)
+
+    def _select_knn(self, lat, lon, k, candidates, return_stats):
+        dist = self.distances(lat, lon, candidates)
+        if k < len(dist):
+            part = np.argpartition(dist, k - 1)[:k]
+            candidates, dist = candidates[part], dist[part]
+        order = np.argsort(dist, kind="stable")
+        indices, dist = candidates[order], dist[order]
+        if return_stats:
+            total = len(self)
+            return indices, dist, QueryStats(total, len(candidates), total - len(candidates), len(indices))
+        return indices, dist
+
+
+class GridIndex(RadiusSearch):
+    """Uniform lat/lon grid bucket index.
+
+    Points are sorted by cell key (row * ncols + col), so the cells of one
+    grid row covering a query's bounding box form a contiguous slice and a
+    query only computes distances for points in nearby cells.
+    """
+
+    def __init__(self, latitudes, longitudes, cell_size_m=250):
+        super().__init__(latitudes, longitudes)
+        lat, lon = self.lat, self.lon
+        positions = np.flatnonzero(self.valid)
+        if len(positions):
+            self.lat0, self.lon0 = lat[positions].min(), lon[positions].min()
+            mid_lat = np.radians(lat[positions].mean())
+        else:
+            self.lat0 = self.lon0 = mid_lat = 0.0
+        self.cell_lat = cell_size_m / METERS_PER_DEGREE_LAT
+        self.cell_lon = self.cell_lat / max(np.cos(mid_lat), 0.01)
+
+        rows = np.floor((lat[positions] - self.lat0) / self.cell_lat).astype(np.int64)
+        cols = np.floor((lon[positions] - self.lon0) / self.cell_lon).astype(np.int64)
+        self.nrows = int(rows.max()) + 1 if len(rows) else 0
+        self.ncols = int(cols.max()) + 1 if len(cols) else 0
+        keys = rows * self.ncols + cols
+        order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[order]
+        self.order = positions[order]
+
+    def _cell_range(self, lat, lon, radius_m):
+        if not np.isfinite(radius_m):
+            return 0, self.nrows - 1, 0, self.ncols - 1
+        dlat = radius_m / METERS_PER_DEGREE_LAT
+        dlon = dlat / max(np.cos(np.radians(lat)), 0.01)
+        row0 = max(int(np.floor((lat - dlat - self.lat0) / self.cell_lat)), 0)
+        row1 = min(int(np.floor((lat + dlat - self.lat0) / self.cell_lat)), self.nrows - 1)
+        col0 = max(int(np.floor((lon - dlon - self.lon0) / self.cell_lon)), 0)
+        col1 = min(int(np.floor((lon + dlon - self.lon0) / self.cell_lon)), self.ncols - 1)
+        return row0, row1, col0, col1
+
+    def _bbox_candidates(self, south, west, north, east):
+        row0 = max(int(np.floor((south - self.lat0) / self.cell_lat)), 0)
+        row1 = min(int(np.floor((north - self.lat0) / self.cell_lat)), self.nrows - 1)
+        col0 = max(int(np.floor((west - self.lon0) / self.cell_lon)), 0)
+        col1 = min(int(np.floor((east - self.lon0) / self.cell_lon)), self.ncols - 1)
+        return self._cells(row0, row1, col0, col1)
+
+    def _candidates(self, lat, lon, radius_m):
+        return self._cells(*self._cell_range(lat, lon, radius_m))
+
+    def _cells(self, row0, row1, col0, col1):
+        if row0 > row1 or col0 > col1:
+            return np.empty(0, dtype=np.int64)
+        rows = np.arange(row0, row1 + 1) * self.ncols
+        starts = np.searchsorted(self.sorted_keys, rows + col0, side="left")
+        ends = np.searchsorted(self.sorted_keys, rows + col1, side="right")
+        return np.concatenate([self.order[s:e] for s, e in zip(starts, ends)])
+
+    def query_knn(self, lat, lon, k, return_stats=False):
+        """k nearest points, growing the search radius until k points fall inside it."""
+        n_valid = len(self.order)
+        radius = max(self.cell_lat * METERS_PER_DEGREE_LAT, 1.0)
+        while True:
+            candidates = self._candidates(lat, lon, radius)
+            if len(candidates) >= min(k, n_valid):
+                inside = candidates[self.distances(lat, lon, candidates) <= radius]
+                if len(inside) >= min(k, n_valid):
+                    return self._select_knn(lat, lon, k, inside, return_stats)
+            if len(candidates) == n_valid:
+                return self._select_knn(lat, lon, k, candidates, return_stats)
+            radius *= 2
+
+
+def nearby(df, search, lat, lon, radius_m, sort=True, distance_col="distance", return_stats=False):
+    """Rows of df within radius_m of (lat, lon), with a distance column in meters."""
+    indices, dist, stats = search.query_radius(lat, lon, radius_m, sort=sort, return_stats=True)
+    result = df.iloc[indices].copy()
+    result[distance_col] = dist
+    if return_stats:
+        return result, stats
+    return result
+
+
+def within_bounds(df, search, south, west, north, east, limit=None):
+    """Rows of df inside the lat/lon box."""
+    return df.iloc[search.query_bbox(south, west, north, east, limit=limit)]
+
+
+def nearest(df, search, lat, lon, k, distance_col="distance"):
+    """The k rows of df nearest to (lat, lon), with a distance column in meters."""
+    indices, dist = search.query_knn(lat, lon, k)
+    result = df.iloc[indices].copy()
+    result[distance_col] = dist
+    return result
+
+
+def _haversine_scalar(lon1, lat1, lon2, lat2):
+    from math import radians, cos, sin, asin, sqrt
+    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * asin(sqrt(a)) * EARTH_RADIUS_M
+
+
+def _loop_nearby(df, lat, lon, radius_m):
+    rows = []
+    for index, row in df.iterrows():
+        if pd.notna(row["latitude"]) and pd.notna(row["longitude"]):
+            if _haversine_scalar(lon, lat, row["longitude"], row["latitude"]) <= radius_m:
+                rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def synthetic_points(n, seed=0, center=(21.0285, 105.8542), spread_deg=0.15):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "latitude": center[0] + rng.uniform(-spread_deg, spread_deg, n),
+        "longitude": center[1] + rng.uniform(-spread_deg, spread_deg, n),
+    })
+
+
+def benchmark(sizes=(1_000, 100_000, 1_000_000), radius_m=1000, loop_limit=1_000_000):
+    lat, lon = 21.0285, 105.8542
+    for n in sizes:
+        df = synthetic_points(n)
+        start = time.perf_counter()
+        search = RadiusSearch(df["latitude"], df["longitude"])
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = nearby(df, search, lat, lon, radius_m)
+        vec = time.perf_counter() - start
+
+        start = time.perf_counter()
+        grid = GridIndex(df["latitude"], df["longitude"])
+        grid_build = time.perf_counter() - start
+        start = time.perf_counter()
+        grid_result, stats = nearby(df, grid, lat, lon, radius_m, return_stats=True)
+        grid_query = time.perf_counter() - start
+        assert len(grid_result) == len(result)
+
+        line = (f"n={n:>9,}  build={build * 1000:8.2f} ms  vectorized={vec * 1000:8.2f} ms  matches={len(result)}"
+                f"  grid_build={grid_build * 1000:8.2f} ms  grid={grid_query * 1000:7.2f} ms  pruned={stats.pruned:,}")
+        if n <= loop_limit:
+            start = time.perf_counter()
+            loop_result = _loop_nearby(df, lat, lon, radius_m)
+            loop = time.perf_counter() - start
+            assert len(loop_result) == len(result)
+            line += f"  iterrows={loop * 1000:10.2f} ms  speedup={loop / vec:8.1f}x"
+        else:
+            line += "  iterrows=skipped"
+        print(line)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -1,11 +1,10 @@
 import pandas as pd
-from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
-import time
-import os
+from geocoding import nominatim_geocoder, provider_limiter
+from batch_geocode import geocode_dataframe
+from gazetteer import PROVIDER_SOURCES, Gazetteer, TieredGeocoder
 
-geolocator = Nominatim(user_agent="manus_geocoder_1.0")
-geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1)
+remote = nominatim_geocoder("manus_geocoder_1.0", limiter=provider_limiter("nominatim"))
+geocode = TieredGeocoder(Gazetteer.from_csv(PROVIDER_SOURCES["nominatim"]), remote, accept=("address",))
 
 input_file_hanoi = "restaurantsHANOI.csv"
 output_file_hanoi = "restaurantsOCEANPARK.csv"
@@ -19,38 +18,14 @@ def geocode_addresses(input_file, output_file):
             print(f"Error: 'Address' column not found in {input_file}")
             return
 
-        latitudes = []
-        longitudes = []
-
-        for address in df['Address']:
-            location = None
-            try:
-                full_address = address
-                if isinstance(address, str):
-                    if 'Việt Nam' not in address and 'Vietnam' not in address and ('Hà Nội' in address or 'Gia Lâm' in address):
-                        full_address = address + ", Việt Nam"
-                    print(f"Geocoding: {full_address}")
-                    location = geocode(full_address, timeout=10)
-                else:
-                    print(f"Skipping invalid address: {address}")
-
-                if location:
-                    latitudes.append(location.latitude)
-                    longitudes.append(location.longitude)
-                    print(f"Found: ({location.latitude}, {location.longitude})")
-                else:
-                    latitudes.append(None)
-                    longitudes.append(None)
-                    print("Not found.")
-            except Exception as e:
-                print(f"Error geocoding '{address}': {e}")
-                latitudes.append(None)
-                longitudes.append(None)
-
-        df['Latitude'] = latitudes
-        df['Longitude'] = longitudes
-        df.to_csv(output_file, index=False, encoding='utf-8-sig')
+        # geocode_dataframe normalizes and dedupes the addresses (see addresses.py)
+        # and appends ", Việt Nam" to each canonical address it sends.
+        df, stats = geocode_dataframe(df, geocode, output_file, source=geocode.source, workers=4)
+        print(f"Geocoded {stats.found}/{stats.rows} rows ({stats.not_found} not found, {stats.failed} failed) "
+              f"in {stats.elapsed:.1f}s, {stats.rows_per_sec:.2f} rows/sec")
         print(f"Successfully processed {input_file} and saved results to {output_file}")
+        print(f"Gazetteer: {geocode.local_hits} local hits; geocode cache: {remote.hits} hits, "
+              f"{remote.misses} network lookups")
 
     except FileNotFoundError:
         print(f"Error: Input file not found at {input_file}")
@@ -1,7 +1,8 @@
 import pandas as pd
 import googlemaps
-import time
-import os
+from geocoding import google_geocoder, provider_limiter
+from batch_geocode import geocode_dataframe
+from gazetteer import PROVIDER_SOURCES, Gazetteer, TieredGeocoder
 
 API_KEY = ''
 
@@ -13,7 +14,9 @@ output_file_oceanpark = "restaurantsOCEANPARK_google_geocoded.csv"
 
 def geocode_addresses_google(input_file, output_file, api_key):
     try:
-        gmaps = googlemaps.Client(key=api_key)
+        remote = google_geocoder(api_key, limiter=provider_limiter("google"))
+        # Addresses Google already placed in an earlier run never reach the API.
+        geocode = TieredGeocoder(Gazetteer.from_csv(PROVIDER_SOURCES["google"]), remote, accept=("address",))
     except Exception as e:
         print(f"Error initializing Google Maps client: {e}")
         return
@@ -24,43 +27,18 @@ def geocode_addresses_google(input_file, output_file, api_key):
             print(f"Error: 'Address' column not found in {input_file}")
             return
 
-        latitudes = []
-        longitudes = []
-
-        print(f"Starting geocoding for {input_file}...")
-        for index, row in df.iterrows():
-            address = row['Address']
-            lat = None
-            lng = None
-            if isinstance(address, str) and address.strip():
-                try:
-                    print(f"Geocoding row {index + 1}: {address}")
-                    geocode_result = gmaps.geocode(address)
-
-                    if geocode_result and len(geocode_result) > 0:
-                        location = geocode_result[0]['geometry']['location']
-                        lat = location['lat']
-                        lng = location['lng']
-                        print(f"  Found: ({lat}, {lng})")
-                    else:
-                        print("  Not found.")
-
-                    time.sleep(0.1)
-
-                except googlemaps.exceptions.ApiError as e:
-                    print(f"  Google Maps API Error for address 	'{address}	': {e}")
-                except Exception as e:
-                    print(f"  Error geocoding address 	'{address}	': {e}")
-            else:
+        for index, address in enumerate(df['Address']):
+            if not (isinstance(address, str) and address.strip()):
                 print(f"Skipping invalid or empty address at row {index + 1}: {address}")
 
-            latitudes.append(lat)
-            longitudes.append(lng)
-
-        df['Latitude'] = latitudes
-        df['Longitude'] = longitudes
-        df.to_csv(output_file, index=False, encoding='utf-8-sig')
+        print(f"Starting geocoding for {input_file}...")
+        df, stats = geocode_dataframe(df, geocode, output_file, source=geocode.source, workers=16,
+                                      retry_on=(googlemaps.exceptions.Timeout, googlemaps.exceptions.TransportError))
+        print(f"Geocoded {stats.found}/{stats.rows} rows ({stats.not_found} not found, {stats.failed} failed) "
+              f"in {stats.elapsed:.1f}s, {stats.rows_per_sec:.2f} rows/sec")
         print(f"Successfully processed {input_file} and saved results to {output_file}")
+        print(f"Gazetteer: {geocode.local_hits} local hits; geocode cache: {remote.hits} hits, "
+              f"{remote.misses} network lookups")
 
     except FileNotFoundError:
         print(f"Error: Input file not found at {input_file}")